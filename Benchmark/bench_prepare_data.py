@@ -0,0 +1,69 @@
+"""Benchmark the array-based prepare_cornac_data against cornac's itertuples path.
+
+Usage:
+    python -m Benchmark.bench_prepare_data --n-ratings 1000000 --n-users 50000 --n-items 20000
+"""
+import argparse
+import numpy as np
+import pandas as pd
+import cornac
+from utils.common.timer import Timer
+from utils.common.constants import DEFAULT_USER_COL, DEFAULT_ITEM_COL, DEFAULT_RATING_COL
+from WRMF.wrmf import prepare_cornac_data
+
+
+def bench_prepare_data(n_ratings=1000000, n_users=50000, n_items=20000, seed=42):
+    """Build a train set from a synthetic rating DataFrame with both paths and check they agree.
+
+    Args:
+        n_ratings (int): number of rating rows (some are duplicated pairs).
+        n_users (int): number of users.
+        n_items (int): number of items.
+        seed (int): random seed of the synthetic data.
+
+    Returns:
+        dict: build time of both paths, speedup and whether the id maps and matrices are equal.
+    """
+    rng = np.random.RandomState(seed)
+    data = pd.DataFrame({
+        DEFAULT_USER_COL: rng.randint(0, n_users, n_ratings),
+        DEFAULT_ITEM_COL: rng.randint(0, n_items, n_ratings),
+        DEFAULT_RATING_COL: rng.randint(1, 6, n_ratings).astype(np.float64),
+    })
+
+    with Timer() as itertuples_timer:
+        reference = cornac.data.Dataset.from_uir(
+            data[[DEFAULT_USER_COL, DEFAULT_ITEM_COL, DEFAULT_RATING_COL]].itertuples(index=False)
+        )
+        reference_csr = reference.csr_matrix
+
+    with Timer() as vectorized_timer:
+        train_set = prepare_cornac_data(data)
+        csr = train_set.csr_matrix
+
+    return {
+        "itertuples s": itertuples_timer.interval,
+        "vectorized s": vectorized_timer.interval,
+        "speedup": itertuples_timer.interval / vectorized_timer.interval,
+        "same id maps": float(
+            list(reference.uid_map.items()) == list(train_set.uid_map.items())
+            and list(reference.iid_map.items()) == list(train_set.iid_map.items())
+        ),
+        "same matrix": float((reference_csr != csr).nnz == 0),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n-ratings", type=int, default=1000000)
+    parser.add_argument("--n-users", type=int, default=50000)
+    parser.add_argument("--n-items", type=int, default=20000)
+    args = parser.parse_args()
+
+    result = bench_prepare_data(args.n_ratings, args.n_users, args.n_items)
+    for name, value in result.items():
+        print("{:<24}{:.4f}".format(name, value))
+
+
+if __name__ == "__main__":
+    main()
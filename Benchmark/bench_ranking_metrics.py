@@ -0,0 +1,120 @@
+"""Benchmark the vectorized ranking metrics at 1M users.
+
+Full-catalog AUC ranks every item for every user (n_users * n_items scores), so it is timed on n_auc_users
+users only (10k by default) and not at 1M users; multiply its time per user to extrapolate.
+
+Usage:
+    python -m Benchmark.bench_ranking_metrics --n-users 1000000 --n-items 50000 --top-k 100
+"""
+import argparse
+import numpy as np
+import scipy.sparse as sp
+from utils.common.timer import Timer
+from Evaluation.fast_ranking_metrics import (
+    get_hits, RankingEvaluator, METRIC_KERNELS, CATALOG_METRICS, full_auc, sampled_auc
+)
+
+
+def _popular_items(cdf, size, rng, block_size=1 << 22):
+    items = np.empty(size, dtype=np.int32)
+    for start in range(0, size, block_size):
+        end = min(start + block_size, size)
+        items[start:end] = np.searchsorted(cdf, rng.random_sample(end - start))
+    return items
+
+
+def make_inputs(n_users, n_items, top_k, n_relevant, rng):
+    """Random recommendation and relevance matrices with popularity-skewed items."""
+    cdf = np.cumsum(1 / np.arange(1, n_items + 1))
+    cdf /= cdf[-1]
+    recommendations = _popular_items(cdf, n_users * top_k, rng).reshape(n_users, top_k)
+    rows = np.repeat(np.arange(n_users, dtype=np.int32), n_relevant)
+    cols = _popular_items(cdf, n_users * n_relevant, rng)
+    relevance = sp.csr_matrix((np.ones(len(rows), dtype=np.float32), (rows, cols)), shape=(n_users, n_items))
+    relevance.data[:] = 1
+    return recommendations, relevance
+
+
+def bench_ranking_metrics(n_users=1000000, n_items=50000, top_k=100, k_list=(5, 10, 20, 100),
+                          n_relevant=10, n_auc_users=10000, auc_block_size=256, n_negatives=100, sampled_block_size=65536, seed=42):
+    """Time the shared hit matrix and every metric kernel.
+
+    Args:
+        n_users (int): number of users.
+        n_items (int): number of items.
+        top_k (int): length of the recommendation lists.
+        k_list (list or tuple): cutoffs.
+        n_relevant (int): relevant items per user.
+        n_auc_users (int): users scored over the full catalog for full AUC.
+        auc_block_size (int): users ranked at a time for full AUC.
+        n_negatives (int): sampled negatives per user for sampled AUC.
+        sampled_block_size (int): users ranked at a time for sampled AUC.
+        seed (int): random seed.
+
+    Returns:
+        dict: seconds per stage
+    """
+    rng = np.random.RandomState(seed)
+    recommendations, relevance = make_inputs(n_users, n_items, top_k, n_relevant, rng)
+    n_relevant = np.asarray(relevance.sum(axis=1)).ravel().astype(np.int64)
+    timings = {}
+
+    with Timer() as t:
+        hits = get_hits(recommendations, relevance)
+    timings["hits"] = t.interval
+
+    for metric in METRIC_KERNELS:
+        evaluator = RankingEvaluator(metrics=(metric,), k_list=k_list)
+        with Timer() as t:
+            evaluator.evaluate_hits(hits, n_relevant)
+        timings[metric] = t.interval
+
+    for metric, (_, catalog_metric) in CATALOG_METRICS.items():
+        with Timer() as t:
+            for k in k_list:
+                catalog_metric(recommendations, n_items, k)
+        timings[metric] = t.interval
+
+    with Timer() as t:
+        RankingEvaluator(metrics=tuple(METRIC_KERNELS) + tuple(CATALOG_METRICS),
+                         k_list=k_list).evaluate(recommendations, relevance, n_items)
+    timings["all metrics (single pass)"] = t.interval
+
+    with Timer() as t:
+        for start in range(0, n_auc_users, auc_block_size):
+            end = min(start + auc_block_size, n_auc_users)
+            scores = rng.normal(size=(end - start, n_items)).astype(np.float32)
+            full_auc(scores, relevance[start:end])
+    timings["full auc ({} users)".format(n_auc_users)] = t.interval
+
+    sampled_auc_time = 0
+    for start in range(0, n_users, sampled_block_size):
+        end = min(start + sampled_block_size, n_users)
+        pos_scores = rng.normal(size=(end - start, n_relevant.max())).astype(np.float32)
+        pos_mask = np.arange(pos_scores.shape[1]) < n_relevant[start:end, None]
+        neg_scores = rng.normal(size=(end - start, n_negatives)).astype(np.float32)
+        with Timer() as t:
+            sampled_auc(pos_scores, neg_scores, pos_mask)
+        sampled_auc_time += t.interval
+    timings["sampled auc"] = sampled_auc_time
+
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    parser.add_argument("--n-users", type=int, default=1000000)
+    parser.add_argument("--n-items", type=int, default=50000)
+    parser.add_argument("--top-k", type=int, default=100)
+    parser.add_argument("--k", type=int, nargs="+", default=[5, 10, 20, 100])
+    parser.add_argument("--n-auc-users", type=int, default=10000)
+    args = parser.parse_args()
+
+    timings = bench_ranking_metrics(args.n_users, args.n_items, args.top_k, args.k,
+                                    n_auc_users=args.n_auc_users)
+    for name, seconds in timings.items():
+        print("{:<32}{:.4f} s".format(name, seconds))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,293 @@
+"""End-to-end benchmarks of fitting, scoring, top-k, evaluation and splitting.
+
+Every case (stage, data size, k) runs in its own subprocess on synthetic Zipf data, so the peak RSS of a
+case is not inflated by the previous ones. Results (wall time, throughput, peak RSS) are written to JSON,
+and compare mode flags regressions of a result file against a baseline.
+
+Usage:
+    python -m Benchmark.run_benchmarks run --sizes small medium --k 10 100 --output bench.json
+    python -m Benchmark.run_benchmarks compare baseline.json bench.json --threshold 0.1
+"""
+import os
+import sys
+import json
+import platform
+import importlib
+import argparse
+import resource
+import tempfile
+import subprocess
+from datetime import datetime
+import numpy as np
+import pandas as pd
+from tabulate import tabulate
+from utils.common.timer import Timer
+
+# data sizes: (n_users, n_items, n_interactions) of the synthetic data
+SIZES = {
+    "small": (1000, 1000, 50000),
+    "medium": (5000, 2000, 500000),
+    "large": (20000, 5000, 2000000),
+}
+MODEL_STAGES = ("fit", "predict_score", "recommend_top_k", "ranking_metrics")
+SPLIT_STAGES = ("split_leave_one_last", "split_temporal_user", "split_temporal_global", "split_random_by_user")
+STAGES = MODEL_STAGES + SPLIT_STAGES
+# stages that depend on k, the others run once per data size
+K_STAGES = ("recommend_top_k", "ranking_metrics")
+ERROR_STAGE = "Invalid stage. Should be one of {}".format(STAGES)
+
+
+def peak_rss_mb():
+    """Peak resident set size of the current process in MB."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # bytes on macOS, kilobytes on Linux
+    return peak / (1 << 20) if sys.platform == "darwin" else peak / (1 << 10)
+
+
+def _top_k_table(model, users, k):
+    """Top-k pivot table of the users (the recommend_top_k output), built with the batched scoring path."""
+    from WRMF.wrmf_utils import top_k_scores, id_array
+
+    user_idx = model.train_set.uid_map.get_indexer(users)
+    items, _ = top_k_scores(model.score_batch(user_idx), k)
+    return pd.DataFrame(
+        id_array(model.train_set.iid_map)[items], index=users, columns=np.arange(1, k + 1)
+    )
+
+
+def run_case(stage, size, k=10, factors=64, max_iter=1, seed=42):
+    """Run one benchmark case in the current process.
+
+    Args:
+        stage (str): one of STAGES.
+        size (str): key of SIZES.
+        k (int): cutoff of recommend_top_k and ranking_metrics.
+        factors (int): latent dimension of the model.
+        max_iter (int): epochs of the fit stage.
+        seed (int): random seed of the data and the model.
+
+    Returns:
+        dict: wall_time (s), throughput, unit, setup_rss_mb (before the stage) and peak_rss_mb.
+    """
+    from Datasets.synthetic import generate_data
+    from Evaluation.data_split import split_data
+
+    if stage not in STAGES:
+        raise ValueError(ERROR_STAGE)
+    n_users, n_items, n_interactions = SIZES[size]
+    data = generate_data(n_users, n_items, n_interactions, seed=seed)
+
+    if stage in SPLIT_STAGES:
+        setup_rss = peak_rss_mb()
+        with Timer() as t:
+            split_data(data, stage[len("split_"):], validation=True, random_state=seed)
+        return dict(wall_time=t.interval, throughput=len(data) / t.interval, unit="rows/s",
+                    setup_rss_mb=setup_rss, peak_rss_mb=peak_rss_mb())
+
+    from WRMF.wrmf import WRMF, prepare_data
+    from WRMF.wrmf_rec import predict_score, recommend_top_k
+    from Evaluation.ranking_metrics import ranking_metrics
+    # imported lazily by ranking_metrics, import it here so that the import is not timed
+    importlib.import_module("Evaluation.fast_ranking_metrics")
+
+    train, test = split_data(data, "random_by_user", random_state=seed)
+    model = WRMF(train, k=factors, max_iter=max_iter, verbose=False, seed=seed)
+    model.train_set = prepare_data(train, seed)
+    model._init()
+    users = test["userID"].unique()
+
+    if stage == "ranking_metrics":
+        top_k = _top_k_table(model, users, k)
+    setup_rss = peak_rss_mb()
+
+    with Timer() as t:
+        if stage == "fit":
+            model.fit(model.train_set)
+        elif stage == "predict_score":
+            predict_score(model, train)
+        elif stage == "recommend_top_k":
+            recommend_top_k(model, train, k)
+        else:
+            ranking_metrics(top_k, test, k)
+
+    if stage == "fit":
+        throughput, unit = max_iter * len(train) / t.interval, "interactions/s"
+    elif stage == "ranking_metrics":
+        throughput, unit = len(users) / t.interval, "users/s"
+    else:
+        throughput, unit = model.train_set.num_users / t.interval, "users/s"
+    return dict(wall_time=t.interval, throughput=throughput, unit=unit,
+                setup_rss_mb=setup_rss, peak_rss_mb=peak_rss_mb())
+
+
+def _run_subprocess(case, timeout):
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        output = os.path.join(tmp_dir, "case.json")
+        command = [sys.executable, "-m", "Benchmark.run_benchmarks", "case", json.dumps(case), output]
+        try:
+            process = subprocess.run(
+                command, cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+                stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, timeout=timeout,
+            )
+        except subprocess.TimeoutExpired:
+            return {"error": "timeout after {} s".format(timeout)}
+        if not os.path.exists(output):
+            stderr = process.stderr.decode(errors="replace").strip().splitlines()
+            return {"error": "exit code {}: {}".format(process.returncode, stderr[-1] if stderr else "")}
+        with open(output) as f:
+            return json.load(f)
+
+
+def run_benchmarks(stages=STAGES, sizes=("small", "medium"), k_list=(10, 100), factors=64, max_iter=1, seed=42,
+                   timeout=3600, verbose=True):
+    """Run every (stage, size, k) case in a subprocess.
+
+    Args:
+        stages (list): stages to run, see STAGES.
+        sizes (list): data sizes, keys of SIZES.
+        k_list (list): cutoffs of recommend_top_k and ranking_metrics.
+        factors (int): latent dimension of the model.
+        max_iter (int): epochs of the fit stage.
+        seed (int): random seed.
+        timeout (int): maximum seconds per case.
+        verbose (bool): print each result.
+
+    Returns:
+        dict: meta (environment and parameters) and results (one dict per case)
+    """
+    results = []
+    for size in sizes:
+        for stage in stages:
+            for k in (k_list if stage in K_STAGES else [None]):
+                case = dict(stage=stage, size=size, k=k, factors=factors, max_iter=max_iter, seed=seed)
+                result = dict(case, **_run_subprocess(case, timeout))
+                results.append(result)
+                if verbose:
+                    print(_format_result(result))
+
+    meta = dict(
+        date=datetime.now().isoformat(timespec="seconds"), python=platform.python_version(),
+        numpy=np.__version__, pandas=pd.__version__, machine=platform.machine(), cpu_count=os.cpu_count(),
+        sizes={size: SIZES[size] for size in sizes},
+    )
+    return {"meta": meta, "results": results}
+
+
+def _format_result(result):
+    name = "{stage} {size} k={k}".format(**result)
+    if "error" in result:
+        return "{:<40} ERROR {}".format(name, result["error"])
+    return "{:<40} {:10.4f} s {:14.1f} {:<16} peak {:8.1f} MB".format(
+        name, result["wall_time"], result["throughput"], result["unit"], result["peak_rss_mb"]
+    )
+
+
+def _case_key(result):
+    return result["stage"], result["size"], result["k"]
+
+
+def compare(baseline, current, threshold=0.1, memory_threshold=None):
+    """Compare benchmark results against a baseline.
+
+    Args:
+        baseline (dict): run_benchmarks output of the baseline.
+        current (dict): run_benchmarks output to check.
+        threshold (float): relative wall time increase flagged as a regression.
+        memory_threshold (float): relative peak RSS increase flagged as a regression. If None, threshold.
+
+    Returns:
+        list: one dict per case in both results, with wall time/peak RSS ratios and a regression flag,
+            and one dict per case in only one of them (or failed in the baseline), with its status
+    """
+    if memory_threshold is None:
+        memory_threshold = threshold
+    base = {_case_key(r): r for r in baseline["results"]}
+    current_keys = set(_case_key(r) for r in current["results"])
+
+    rows = []
+    for result in current["results"]:
+        reference = base.get(_case_key(result))
+        if reference is None or "error" in reference:
+            rows.append(dict(zip(("stage", "size", "k"), _case_key(result)), time_ratio=None, rss_ratio=None,
+                             regression=False,
+                             status="not in baseline" if reference is None else "failed in baseline"))
+            continue
+        if "error" in result:
+            rows.append(dict(zip(("stage", "size", "k"), _case_key(result)), time_ratio=None, rss_ratio=None,
+                             regression=True, status="error: {}".format(result["error"])))
+            continue
+        time_ratio = result["wall_time"] / reference["wall_time"]
+        rss_ratio = result["peak_rss_mb"] / reference["peak_rss_mb"]
+        rows.append(dict(
+            zip(("stage", "size", "k"), _case_key(result)),
+            baseline_time=reference["wall_time"], time=result["wall_time"], time_ratio=time_ratio,
+            baseline_rss_mb=reference["peak_rss_mb"], rss_mb=result["peak_rss_mb"], rss_ratio=rss_ratio,
+            regression=time_ratio > 1 + threshold or rss_ratio > 1 + memory_threshold, status="ok",
+        ))
+    for key in base:
+        if key not in current_keys:
+            rows.append(dict(zip(("stage", "size", "k"), key), time_ratio=None, rss_ratio=None, regression=False,
+                             status="not in current"))
+    return rows
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.split("\n")[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="run the benchmarks and write the results to JSON")
+    run_parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=STAGES)
+    run_parser.add_argument("--sizes", nargs="+", default=["small", "medium"], choices=list(SIZES))
+    run_parser.add_argument("--k", nargs="+", type=int, default=[10, 100])
+    run_parser.add_argument("--factors", type=int, default=64)
+    run_parser.add_argument("--max-iter", type=int, default=1)
+    run_parser.add_argument("--seed", type=int, default=42)
+    run_parser.add_argument("--timeout", type=int, default=3600)
+    run_parser.add_argument("--output", default="benchmark_results.json")
+
+    compare_parser = commands.add_parser("compare", help="flag regressions against a baseline")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.1)
+    compare_parser.add_argument("--memory-threshold", type=float, default=None)
+
+    case_parser = commands.add_parser("case", help=argparse.SUPPRESS)
+    case_parser.add_argument("case")
+    case_parser.add_argument("output")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmarks(args.stages, args.sizes, args.k, args.factors, args.max_iter, args.seed,
+                                 args.timeout)
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+        print("Results written to {}".format(args.output))
+
+    elif args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        rows = compare(baseline, current, args.threshold, args.memory_threshold)
+        print(tabulate(rows, headers="keys", floatfmt=".4f"))
+        n_regressions = sum(row["regression"] for row in rows)
+        n_compared = sum(row["status"] == "ok" or row["regression"] for row in rows)
+        print("{} regression(s) in {} case(s), {} case(s) not compared".format(
+            n_regressions, n_compared, len(rows) - n_compared
+        ))
+        sys.exit(1 if n_regressions else 0)
+
+    else:
+        case = json.loads(args.case)
+        try:
+            result = run_case(case["stage"], case["size"], case["k"] or 10, case["factors"], case["max_iter"],
+                              case["seed"])
+        except Exception as e:
+            result = {"error": "{}: {}".format(type(e).__name__, e)}
+        with open(args.output, "w") as f:
+            json.dump(result, f)
+
+
+if __name__ == "__main__":
+    main()
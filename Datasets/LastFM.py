@@ -1,18 +1,25 @@
-import pandas as pd
+import os
+import numpy as np
 from utils.common.constants import (
     DEFAULT_USER_COL,
     DEFAULT_ITEM_COL,
     DEFAULT_RATING_COL,
 )
 from Datasets.download_utils import (
-    download_path, maybe_download, extract_file_from_zip
+    download_path, maybe_download, open_from_zip
 )
+from Datasets.parse_utils import (
+    read_delimited, rating_dtypes, save_npz_frame, load_npz_frame
+)
+from Datasets.sparse_loader import load_sparse as load_sparse_file, DEFAULT_CHUNK_SIZE, SparseRatings
 
 URL_LAST_FM = "http://files.grouplens.org/datasets/hetrec2011/hetrec2011-lastfm-2k.zip"
 LAST_FM_FILE_NAME = "user_artists.dat"
+LAST_FM_CACHE_NAME = "hetrec2011-lastfm-2k.npz"
+ERROR_HEADER = "Invalid data header. It consists of three columns (user_id, artist_id, weight)."
 
 
-def load_data(header=None, local_cache_path=None, unzip_path=None):
+def load_data(header=None, local_cache_path=None, unzip_path=None, log_transform=False):
     """ Load Last.FM Dataset
     Download the dataset from https://grouplens.org/datasets/hetrec-2011/
     Notice that this data doesn't contain timestamp column.
@@ -20,19 +27,60 @@ def load_data(header=None, local_cache_path=None, unzip_path=None):
     Args:
         header (list or tuple or None): dataset header.
         local_cache_path (str or None): Path to cache the downloaded file.
+            The parsed data is cached next to it as hetrec2011-lastfm-2k.npz, so repeated loads skip parsing.
             If None, all the intermediate files will be stored in a temporary directory and removed after use.
         unzip_path (str): Path to save extracted file from zip file.
+            If None, the file is read straight from the zip file.
+        log_transform (bool): if True, play counts w are replaced by log(1 + w).
     Returns:
-        pd.DataFrame: Last.FM Datset
+        pd.DataFrame: Last.FM Datset. Ids are int32 and play counts float32.
     """
 
     if header is None:
         header = [DEFAULT_USER_COL, DEFAULT_ITEM_COL, DEFAULT_RATING_COL]
+    elif len(header) != 3:
+        raise ValueError(ERROR_HEADER)
 
     with download_path(local_cache_path) as path:
-        zip_file_path = maybe_download(URL_LAST_FM, work_directory=path)
-        data_file_path = extract_file_from_zip(zip_file_path, LAST_FM_FILE_NAME, unzip_path)
-        last_fm_df = pd.read_table(data_file_path, header=None, sep=r"\s", skiprows=[0],
-                                   names=header, engine='python')
+        zip_file_path = os.path.join(path, URL_LAST_FM.split("/")[-1])
+        cache_path = os.path.join(path, LAST_FM_CACHE_NAME)
+
+        last_fm_df = load_npz_frame(cache_path, header, source=zip_file_path)
+        if last_fm_df is None:
+            zip_file_path = maybe_download(URL_LAST_FM, work_directory=path)
+            with open_from_zip(zip_file_path, LAST_FM_FILE_NAME, unzip_path) as data_file:
+                last_fm_df = read_delimited(data_file, sep="\t", names=header, header=0,
+                                            dtype=rating_dtypes(header))
+            save_npz_frame(cache_path, last_fm_df, source=zip_file_path)
+
+    if log_transform:
+        last_fm_df[header[2]] = np.log1p(last_fm_df[header[2]])
 
     return last_fm_df
+
+
+def load_sparse(local_cache_path=None, unzip_path=None, chunksize=DEFAULT_CHUNK_SIZE, log_transform=False):
+    """ Load Last.FM play counts as a sparse user-artist matrix, streaming the file in chunks.
+    No DataFrame of the whole file is built, see Datasets.sparse_loader.load_sparse.
+
+    Args:
+        local_cache_path (str or None): Path to cache the downloaded file.
+            If None, all the intermediate files will be stored in a temporary directory and removed after use.
+        unzip_path (str): Path to save extracted file from zip file.
+            If None, the file is read straight from the zip file.
+        chunksize (int): number of rows parsed at a time.
+        log_transform (bool): if True, play counts w are replaced by log(1 + w), e.g. for confidence weighting.
+    Returns:
+        SparseRatings: csr, csc (float32 play counts), user_ids and item_ids.
+    """
+
+    with download_path(local_cache_path) as path:
+        zip_file_path = maybe_download(URL_LAST_FM, work_directory=path)
+        with open_from_zip(zip_file_path, LAST_FM_FILE_NAME, unzip_path) as data_file:
+            ratings = load_sparse_file(data_file, sep="\t", header=0, chunksize=chunksize)
+
+    if log_transform:
+        csr = ratings.csr.log1p()
+        ratings = SparseRatings(csr, csr.tocsc(), ratings.user_ids, ratings.item_ids)
+
+    return ratings
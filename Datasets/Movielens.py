@@ -1,15 +1,18 @@
 import os
 import re
 from collections import namedtuple
-import pandas as pd
+import numpy as np
 from utils.common.constants import (
-    DEFAULT_USER_COL,
     DEFAULT_ITEM_COL,
     DEFAULT_HEADER
 )
 from Datasets.download_utils import (
-    download_path, maybe_download, extract_file_from_zip
+    download_path, maybe_download, open_from_zip
 )
+from Datasets.parse_utils import (
+    read_delimited, rating_dtypes, save_npz_frame, load_npz_frame
+)
+from Datasets.sparse_loader import load_sparse as load_sparse_file, DEFAULT_CHUNK_SIZE
 
 URL_MOVIE_LENS = "http://files.grouplens.org/datasets/movielens/"
 ERROR_MOVIE_LENS_SIZE = "Invalid data size. Should be one of {'100k', '1m', '10m', '20m'}"
@@ -74,15 +77,17 @@ def load_data(size="100k",
         size (str): Size of the data to load. One of ("100k", "1m", "10m", "20m").
         header (list or tuple or None): Rating dataset header.
         local_cache_path (str): Path (directory or a zip file) to cache the downloaded zip file.
+            The parsed ratings are cached next to it as ml-<size>.ratings.npz, so repeated loads skip parsing.
             If None, all the intermediate files will be stored in a temporary directory and removed after use.
         unzip_path (str): Path to save extracted file from zip file.
+            If None, the files are parsed straight from the zip file.
         title_col (str): Movie title column name. If None, the column will not be loaded.
         genres_col (str): Genres column name. Genres are '|' separated string.
             If None, the column will not be loaded.
         year_col (str): Movie release year column name. If None, the column will not be loaded.
 
     Returns:
-        pd.DataFrame: Movie rating dataset.
+        pd.DataFrame: Movie rating dataset. Ids are int32, rating float32 and timestamp int64.
 
     """
 
@@ -99,29 +104,31 @@ def load_data(size="100k",
     with download_path(local_cache_path) as path:
         zip_path = os.path.join(path, "ml-{}.zip".format(size))
         dirs, file = os.path.split(zip_path)
-        filepath = maybe_download(url, file, work_directory=dirs)
-
-        rating_path = extract_file_from_zip(filepath, ML_FORMAT[size].rating_path, unzip_path)
-        item_path = extract_file_from_zip(filepath, ML_FORMAT[size].item_path, unzip_path)
-
-        # Load rating data
-        rating_df = pd.read_csv(
-            rating_path,
-            sep=ML_FORMAT[size].rating_sep,
-            engine="python",
-            names=header,
-            usecols=[*range(len(header))],
-            header=0 if ML_FORMAT[size].rating_header else None,
-        )
+        cache_path = os.path.join(dirs, "ml-{}.ratings.npz".format(size))
+
+        # Load rating data, from the parsed data cache if it is up to date
+        rating_df = load_npz_frame(cache_path, header, source=zip_path)
+        if rating_df is None:
+            filepath = maybe_download(url, file, work_directory=dirs)
+            with open_from_zip(filepath, ML_FORMAT[size].rating_path, unzip_path) as rating_file:
+                rating_df = read_delimited(
+                    rating_file,
+                    sep=ML_FORMAT[size].rating_sep,
+                    names=header,
+                    usecols=[*range(len(header))],
+                    header=0 if ML_FORMAT[size].rating_header else None,
+                    dtype=rating_dtypes(header),
+                )
+            save_npz_frame(cache_path, rating_df, source=filepath)
 
         # Load movie features such as title, genres, and release year
-        item_df = load_item_df(
-            size, item_path, DEFAULT_ITEM_COL, title_col, genres_col, year_col
-        )
-
-        # Convert 'rating' type to float
-        if len(header) > 2:
-            rating_df[header[2]] = rating_df[DEFAULT_USER_COL].astype(float)
+        item_df = None
+        if title_col is not None or genres_col is not None or year_col is not None:
+            filepath = maybe_download(url, file, work_directory=dirs)
+            with open_from_zip(filepath, ML_FORMAT[size].item_path, unzip_path) as item_file:
+                item_df = load_item_df(
+                    size, item_file, DEFAULT_ITEM_COL, title_col, genres_col, year_col
+                )
 
         # Merge rating df w/ item_df
         if item_df is not None:
@@ -131,13 +138,46 @@ def load_data(size="100k",
             return rating_df
 
 
+def load_sparse(size="100k", local_cache_path=None, unzip_path=None, chunksize=DEFAULT_CHUNK_SIZE):
+    """Loads the MovieLens ratings as a sparse user-item matrix, streaming the ratings file in chunks.
+    No DataFrame of the whole ratings file is built, see Datasets.sparse_loader.load_sparse.
+
+    Args:
+        size (str): Size of the data to load. One of ("100k", "1m", "10m", "20m").
+        local_cache_path (str): Path (directory or a zip file) to cache the downloaded zip file.
+            If None, all the intermediate files will be stored in a temporary directory and removed after use.
+        unzip_path (str): Path to save extracted file from zip file.
+            If None, the ratings are streamed straight from the zip file.
+        chunksize (int): number of rows parsed at a time.
+
+    Returns:
+        SparseRatings: csr, csc (float32 ratings), user_ids and item_ids.
+    """
+    size = size.lower()
+    if size not in ML_FORMAT:
+        raise ValueError(ERROR_MOVIE_LENS_SIZE)
+
+    url = URL_MOVIE_LENS + 'ml-' + size + ".zip"
+    with download_path(local_cache_path) as path:
+        zip_path = os.path.join(path, "ml-{}.zip".format(size))
+        dirs, file = os.path.split(zip_path)
+        filepath = maybe_download(url, file, work_directory=dirs)
+        with open_from_zip(filepath, ML_FORMAT[size].rating_path, unzip_path) as rating_file:
+            return load_sparse_file(
+                rating_file,
+                sep=ML_FORMAT[size].rating_sep,
+                header=0 if ML_FORMAT[size].rating_header else None,
+                chunksize=chunksize,
+            )
+
+
 def load_item_df(size, item_data_path, movie_col, title_col, genres_col, year_col):
     """Loads Movie info.
     original source code - "https://github.com/microsoft/recommenders/blob/main/reco_utils/dataset/movielens.py"
 
     Args:
         size (str): Size of the data to load. One of ("100k", "1m", "10m", "20m").
-        item_data_path (str): Path with item data.
+        item_data_path (str or file): Path with item data, or binary file object.
         movie_col (str): Movie id column name.
         title_col (str): Movie title column name. If None, the column will not be loaded.
         genres_col (str): Genres column name. Genres are '|' separated string.
@@ -172,13 +212,13 @@ def load_item_df(size, item_data_path, movie_col, title_col, genres_col, year_co
             item_header.append(genres_col)
             usecols.append(2)  # genres column
 
-    item_df = pd.read_csv(
+    item_df = read_delimited(
         item_data_path,
         sep=ML_FORMAT[size].item_sep,
-        engine="python",
         names=item_header,
         usecols=usecols,
         header=0 if ML_FORMAT[size].item_header else None,
+        dtype={movie_col: np.int32},
         encoding="ISO-8859-1",
     )
 
@@ -1,18 +1,136 @@
 import os
+import json
 import logging
-import math
+import hashlib
 from tqdm import tqdm
 import shutil
 import zipfile
+from urllib.parse import urlparse
+from urllib.request import url2pathname
 from tempfile import TemporaryDirectory
 from contextlib import contextmanager
 import requests
 
 log = logging.getLogger(__name__)
 
+DEFAULT_BLOCK_SIZE = 1 << 20
+# environment variable with extra mirrors (comma separated base urls, e.g. file:///data/mirror,https://host/data)
+MIRRORS_ENV = "WRMF_DATA_MIRRORS"
+# mirrors tried before the original url, in order. Each mirror is a base url holding the files by name.
+MIRRORS = []
 
-def maybe_download(url, filename=None, work_directory=".", expected_bytes=None):
+
+def file_sha256(path, block_size=DEFAULT_BLOCK_SIZE):
+    """Return the sha256 hex digest of a file."""
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def get_mirrors(mirrors=None):
+    """Return the mirror base urls to try: the given ones, MIRRORS_ENV, then MIRRORS."""
+    env = [m.strip() for m in os.environ.get(MIRRORS_ENV, "").split(",") if m.strip()]
+    return list(mirrors or []) + env + list(MIRRORS)
+
+
+def _verify(path, expected_bytes=None, sha256=None):
+    if expected_bytes is not None and os.path.getsize(path) != expected_bytes:
+        return False
+    if sha256 is not None and file_sha256(path) != sha256.lower():
+        return False
+    return True
+
+
+def _read_part_info(part_path):
+    """Return the source of a partial download (url, validator, size), None if unknown."""
+    try:
+        with open(part_path + ".json", "r") as f:
+            return json.load(f)
+    except (IOError, ValueError):
+        return None
+
+
+def _write_part_info(part_path, url, validator, size):
+    with open(part_path + ".json", "w") as f:
+        json.dump({"url": url, "validator": validator, "size": size}, f)
+
+
+def _remove_part(part_path):
+    for path in (part_path, part_path + ".json"):
+        if os.path.exists(path):
+            os.remove(path)
+
+
+def _validator(headers):
+    """Strong ETag, or Last-Modified, of a response: identifies the version of the file for If-Range."""
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        return etag
+    return headers.get("last-modified")
+
+
+def _download_to(url, part_path, block_size, verified=False):
+    """Download url into part_path, resuming a partial file with an HTTP Range request.
+    A partial file is resumed only if it was downloaded from the same url and the server still serves the same
+    version of the file (If-Range with the ETag or Last-Modified of the first response), or if the result is
+    verified against a checksum afterwards (verified=True). The size is checked against the server's.
+    """
+    parsed = urlparse(url)
+    if parsed.scheme == "file":
+        shutil.copyfile(url2pathname(parsed.path), part_path)
+        return
+
+    info = _read_part_info(part_path)
+    offset = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+    same_source = info is not None and info["url"] == url and info["validator"] is not None
+    if offset > 0 and not (same_source or verified):
+        log.info("Restarting download of {}: the partial file cannot be matched to it".format(url))
+        _remove_part(part_path)
+        offset = 0
+
+    headers = {}
+    if offset > 0:
+        headers["Range"] = "bytes={}-".format(offset)
+        if same_source:
+            # the server sends the whole file (200) instead of the range if the file changed since
+            headers["If-Range"] = info["validator"]
+    with requests.get(url, stream=True, headers=headers, timeout=60) as r:
+        if r.status_code == 416:
+            if info is not None and info["size"] == offset:
+                # the partial file is already complete
+                return
+            _remove_part(part_path)
+            raise IOError("Invalid partial download of {}".format(url))
+        r.raise_for_status()
+        if r.status_code != 206:
+            offset = 0
+        total_size = int(r.headers.get("content-length", 0)) + offset
+        if offset == 0:
+            _write_part_info(part_path, url, _validator(r.headers), total_size)
+
+        with open(part_path, "ab" if offset > 0 else "wb") as file, tqdm(
+                total=total_size, initial=offset, unit="B", unit_scale=True,
+        ) as progress:
+            for data in r.iter_content(block_size):
+                file.write(data)
+                progress.update(len(data))
+
+    # iter_content decodes compressed content, sizes only compare for identity encoding
+    identity = r.headers.get("content-encoding", "identity") == "identity"
+    if identity and "content-length" in r.headers and os.path.getsize(part_path) != total_size:
+        raise IOError("Incomplete download of {}: {} of {} bytes".format(url, os.path.getsize(part_path), total_size))
+
+
+def maybe_download(url, filename=None, work_directory=".", expected_bytes=None, sha256=None,
+                   block_size=DEFAULT_BLOCK_SIZE, mirrors=None):
     """Download a file if it is not already downloaded.
+    The file is downloaded into `<filename>.part`, verified, and renamed into place, so an interrupted download
+    never looks like a complete file. A partial file is resumed with an HTTP Range request when it comes from the
+    same url and the server still serves the same version of the file (If-Range), or when `sha256` is given.
+    The size is always checked against the one announced by the server.
+    Mirrors (including `file://` local directories) are tried before the original url.
     original source code - "https://github.com/microsoft/recommenders/blob/main/reco_utils/dataset/download_utils.py"
 
     Args:
@@ -20,6 +138,9 @@ def maybe_download(url, filename=None, work_directory=".", expected_bytes=None):
         filename (str): File name.
         work_directory (str): Working directory.
         expected_bytes (int): Expected file size in bytes.
+        sha256 (str): Expected sha256 hex digest of the file. If given, a partial download is resumed from any source.
+        block_size (int): Number of bytes written at a time.
+        mirrors (list): Mirror base urls holding the file by name, tried first. See get_mirrors.
 
     Returns:
          str: File path of the file downloaded.
@@ -30,29 +151,33 @@ def maybe_download(url, filename=None, work_directory=".", expected_bytes=None):
     os.makedirs(work_directory, exist_ok=True)
     filepath = os.path.join(work_directory, filename)
 
-    if not os.path.exists(filepath):
-        r = requests.get(url, stream=True)
-        total_size = int(r.headers.get("content-length", 0))
-        block_size = 1024
-        num_iterables = math.ceil(total_size / block_size)
-
-        with open(filepath, "wb") as file:
-            for data in tqdm(
-                    r.iter_content(block_size),
-                    total=num_iterables,
-                    unit="KB",
-                    unit_scale=True,
-            ):
-                file.write(data)
-    else:
+    if os.path.exists(filepath):
         log.info("File {} already downloaded".format(filepath))
-    if expected_bytes is not None:
-        statinfo = os.stat(filepath)
-        if statinfo.st_size != expected_bytes:
+        if not _verify(filepath, expected_bytes, sha256):
             os.remove(filepath)
             raise IOError("Failed to verify {}".format(filepath))
+        return filepath
+
+    part_path = filepath + ".part"
+    urls = [m.rstrip("/") + "/" + url.split("/")[-1] for m in get_mirrors(mirrors)] + [url]
+    for source in urls:
+        try:
+            _download_to(source, part_path, block_size, verified=sha256 is not None)
+        except (IOError, requests.RequestException) as e:
+            log.info("Download from {} failed: {}".format(source, e))
+            continue
+
+        if _verify(part_path, expected_bytes, sha256):
+            os.replace(part_path, filepath)
+            _remove_part(part_path)
+            if log.isEnabledFor(logging.INFO):
+                # the digest can be passed as sha256 to pin the file
+                log.info("Downloaded {} (sha256={})".format(filepath, sha256 or file_sha256(filepath)))
+            return filepath
+        log.info("Failed to verify {} downloaded from {}".format(filename, source))
+        _remove_part(part_path)
 
-    return filepath
+    raise IOError("Failed to download {}".format(filename))
 
 
 @contextmanager
@@ -110,4 +235,25 @@ def extract_file_from_zip(zip_path, file_path, path=None):
     return extracted_path
 
 
+@contextmanager
+def open_from_zip(zip_path, file_path, path=None):
+    """Open a file of a zip archive for reading in binary mode.
+    The member is streamed from the archive, without writing it to disk. It is extracted first only if
+    `path` is given, i.e. when the extracted file should be kept.
+
+    Args:
+        zip_path (str): Zip file path
+        file_path (str): Path of the file in the archive
+        path (str): Path to save extracted file. If None, the file is not extracted.
+
+    Returns:
+        file: binary file object
+    """
+
+    if path is not None:
+        with open(extract_file_from_zip(zip_path, file_path, path), "rb") as f:
+            yield f
+    else:
+        with zipfile.ZipFile(zip_path, "r") as z, z.open(file_path) as f:
+            yield f
 
@@ -0,0 +1,110 @@
+import io
+import os
+import csv
+import numpy as np
+import pandas as pd
+
+# single-byte separator that multi-character separators (e.g. MovieLens "::") are translated to
+TRANSLATED_SEP = "\x1f"
+# compact dtypes of the rating columns by position: user id, item id, rating, timestamp
+RATING_DTYPES = (np.int32, np.int32, np.float32, np.int64)
+
+
+def rating_dtypes(header):
+    """Return the compact dtype of every rating column, by column name."""
+    return dict(zip(header, RATING_DTYPES))
+
+
+def translate_separator(data, sep, new_sep=TRANSLATED_SEP):
+    """Translate a multi-character separator to a single byte, so that the C parser can be used.
+
+    Args:
+        data (bytes): raw file content.
+        sep (str): separator of the file, e.g. "::".
+        new_sep (str): single-character separator to translate to.
+
+    Returns:
+        bytes: translated content
+    """
+    return data.replace(sep.encode(), new_sep.encode())
+
+
+def read_delimited(path, sep, names, usecols=None, header=None, dtype=None, encoding=None):
+    """Read a delimited file with the C parser.
+    Multi-character separators are translated to TRANSLATED_SEP in memory first, and quoting is disabled
+    for them, as the python parser does with a regular expression separator.
+
+    Args:
+        path (str or file): file path or binary file object.
+        sep (str): separator.
+        names (list): column names.
+        usecols (list): column positions to read.
+        header (int): row number of the header, None if the file has no header.
+        dtype (dict): dtype by column name.
+        encoding (str): file encoding.
+
+    Returns:
+        pd.DataFrame: parsed data
+    """
+    kwargs = {}
+    if len(sep) > 1:
+        if isinstance(path, str):
+            with open(path, "rb") as f:
+                data = f.read()
+        else:
+            data = path.read()
+        path = io.BytesIO(translate_separator(data, sep))
+        sep = TRANSLATED_SEP
+        kwargs["quoting"] = csv.QUOTE_NONE
+
+    return pd.read_csv(
+        path,
+        sep=sep,
+        engine="c",
+        names=names,
+        usecols=usecols,
+        header=header,
+        dtype=dtype,
+        encoding=encoding,
+        **kwargs,
+    )
+
+
+def save_npz_frame(path, df, source=None):
+    """Save the columns of a DataFrame as arrays in an npz file, written atomically.
+
+    Args:
+        path (str): npz file path.
+        df (pd.DataFrame): data with numeric columns.
+        source (str): file the data was parsed from. Its size is stored to detect a stale cache.
+    """
+    arrays = {"col_{}".format(i): df[c].to_numpy() for i, c in enumerate(df.columns)}
+    arrays["source_size"] = np.int64(os.path.getsize(source) if source is not None else -1)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "wb") as f:
+        np.savez(f, **arrays)
+    os.replace(tmp_path, path)
+
+
+def load_npz_frame(path, names, source=None):
+    """Load a DataFrame saved by save_npz_frame.
+
+    Args:
+        path (str): npz file path.
+        names (list): column names, in the saved column order.
+        source (str): file the data was parsed from. If it exists and its size differs from the stored one,
+            the cache is stale.
+
+    Returns:
+        pd.DataFrame: cached data, or None if there is no usable cache.
+    """
+    if not os.path.exists(path):
+        return None
+    with np.load(path) as arrays:
+        n_cols = sum(1 for key in arrays.files if key.startswith("col_"))
+        if n_cols != len(names):
+            return None
+        if source is not None and os.path.exists(source) and \
+                int(arrays["source_size"]) != os.path.getsize(source):
+            return None
+        return pd.DataFrame({name: arrays["col_{}".format(i)] for i, name in enumerate(names)})
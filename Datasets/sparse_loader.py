@@ -0,0 +1,172 @@
+import io
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from Datasets.parse_utils import TRANSLATED_SEP
+
+DEFAULT_CHUNK_SIZE = 1 << 20
+# user-item matrix of a ratings file in CSR and CSC, rows/columns are the raw ids in order of first appearance
+SparseRatings = namedtuple("SparseRatings", ["csr", "csc", "user_ids", "item_ids"])
+
+
+class GrowableArray:
+    """1-D numpy buffer with amortized O(1) appends (the capacity doubles when full)."""
+
+    def __init__(self, dtype, capacity=1024):
+        self.data = np.empty(capacity, dtype=dtype)
+        self.size = 0
+
+    def append(self, values):
+        end = self.size + len(values)
+        if end > len(self.data):
+            data = np.empty(max(end, 2 * len(self.data)), dtype=self.data.dtype)
+            data[:self.size] = self.data[:self.size]
+            self.data = data
+        self.data[self.size:end] = values
+        self.size = end
+
+    def view(self):
+        return self.data[:self.size]
+
+
+class IdEncoder:
+    """Incremental id encoder: ids get consecutive int32 codes in order of first appearance, chunk by chunk."""
+
+    def __init__(self):
+        self.index = None
+        self.chunks = []
+
+    def encode(self, ids):
+        """Return the codes of ids, adding the unseen ones."""
+        if self.index is None:
+            self.index = pd.Index(ids[:0])
+        codes = self.index.get_indexer(ids)
+        unseen = codes < 0
+        if unseen.any():
+            new_ids = pd.unique(ids[unseen])
+            self.chunks.append(new_ids)
+            self.index = self.index.append(pd.Index(new_ids))
+            codes[unseen] = self.index.get_indexer(ids[unseen])
+        return codes.astype(np.int32)
+
+    @property
+    def ids(self):
+        return np.concatenate(self.chunks) if self.chunks else np.array([])
+
+    def __len__(self):
+        return 0 if self.index is None else len(self.index)
+
+
+class SeparatorTranslator(io.RawIOBase):
+    """Binary stream that translates a multi-character separator (e.g. MovieLens "::") to a single byte
+    on the fly, so that files can be streamed to the C parser without reading them whole.
+
+    Args:
+        raw (file): binary file object to read from.
+        sep (str): separator to translate.
+        new_sep (str): single-character separator to translate to.
+        block_size (int): number of bytes read at a time.
+        close_raw (bool): if True, closing the translator closes raw.
+    """
+
+    def __init__(self, raw, sep, new_sep=TRANSLATED_SEP, block_size=1 << 22, close_raw=False):
+        self.raw = raw
+        self.close_raw = close_raw
+        self.sep = sep.encode()
+        self.new_sep = new_sep.encode()
+        self.block_size = block_size
+        self.pending = memoryview(b"")
+        self.carry = b""
+
+    def readable(self):
+        return True
+
+    def close(self):
+        if not self.closed and self.close_raw:
+            self.raw.close()
+        super().close()
+
+    def _fill(self):
+        block = self.raw.read(self.block_size)
+        if not block:
+            self.pending, self.carry = memoryview(self.carry.replace(self.sep, self.new_sep)), b""
+            return False
+        # translate complete lines only, a separator never spans a line break
+        data = self.carry + block
+        cut = data.rfind(b"\n") + 1
+        self.pending, self.carry = memoryview(data[:cut].replace(self.sep, self.new_sep)), data[cut:]
+        return True
+
+    def readinto(self, buffer):
+        while not len(self.pending):
+            if not self._fill() and not len(self.pending):
+                return 0
+        n = min(len(buffer), len(self.pending))
+        buffer[:n] = self.pending[:n]
+        self.pending = self.pending[n:]
+        return n
+
+
+def _open_stream(path, sep):
+    """Return a (binary file, separator) pair to parse, translating multi-character separators."""
+    f = open(path, "rb") if isinstance(path, str) else path
+    if len(sep) > 1:
+        # the translator owns the file it opened, closing the stream closes both
+        return io.BufferedReader(SeparatorTranslator(f, sep, close_raw=isinstance(path, str))), TRANSLATED_SEP
+    return f, sep
+
+
+def load_sparse(path, sep, user_col=0, item_col=1, rating_col=2, header=None, chunksize=DEFAULT_CHUNK_SIZE,
+                encoding=None):
+    """Stream a delimited ratings file into a sparse user-item matrix, without building a DataFrame of the file.
+    The file is parsed in chunks with the C parser. User and item ids are encoded incrementally and the
+    codes and ratings are appended to growable int32/float32 COO buffers, converted to CSR and CSC at the end.
+    Duplicate user-item pairs are summed.
+
+    Args:
+        path (str or file): file path or binary file object.
+        sep (str): separator. Multi-character separators are translated while streaming.
+        user_col (int): position of the user id column.
+        item_col (int): position of the item id column.
+        rating_col (int): position of the rating column. If None, every row counts 1.
+        header (int): row number of the header, None if the file has no header.
+        chunksize (int): number of rows parsed at a time.
+        encoding (str): file encoding.
+
+    Returns:
+        SparseRatings: csr, csc (scipy.sparse float32 matrices), user_ids and item_ids.
+    """
+    usecols = [user_col, item_col] + ([] if rating_col is None else [rating_col])
+    # parsed columns come in file order
+    names = {user_col: "user", item_col: "item", rating_col: "rating"}
+    names = [names[c] for c in sorted(usecols)]
+    user_encoder, item_encoder = IdEncoder(), IdEncoder()
+    rows, cols = GrowableArray(np.int32), GrowableArray(np.int32)
+    values = GrowableArray(np.float32)
+
+    f, sep = _open_stream(path, sep)
+    try:
+        try:
+            reader = pd.read_csv(
+                f, sep=sep, engine="c", header=header, usecols=usecols, chunksize=chunksize, encoding=encoding,
+            )
+        except pd.errors.EmptyDataError:
+            # empty file, an empty matrix
+            reader = []
+        for chunk in reader:
+            chunk.columns = names
+            rows.append(user_encoder.encode(chunk["user"].to_numpy()))
+            cols.append(item_encoder.encode(chunk["item"].to_numpy()))
+            if rating_col is None:
+                values.append(np.ones(len(chunk), dtype=np.float32))
+            else:
+                values.append(chunk["rating"].to_numpy(dtype=np.float32))
+    finally:
+        if isinstance(path, str):
+            f.close()
+
+    csr = sp.csr_matrix(
+        (values.view(), (rows.view(), cols.view())), shape=(len(user_encoder), len(item_encoder))
+    )
+    return SparseRatings(csr, csr.tocsc(), user_encoder.ids, item_encoder.ids)
@@ -0,0 +1,79 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from Datasets.parse_utils import rating_dtypes
+from utils.common.constants import DEFAULT_HEADER
+
+DEFAULT_CHUNK_SIZE = 1 << 23
+# timestamps are drawn uniformly in [START_TIME, END_TIME), unix seconds of 2000-01-01 and 2020-01-01
+START_TIME = 946684800
+END_TIME = 1577836800
+ERROR_OUTPUT = "Invalid output. Should be one of {'df', 'csr'}"
+
+
+def zipf_cdf(n, alpha):
+    """Cumulative distribution of a finite Zipf law, p(rank r) proportional to 1 / r^alpha, r = 1..n."""
+    cdf = np.cumsum(np.arange(1, n + 1, dtype=np.float64) ** -alpha)
+    return cdf / cdf[-1]
+
+
+def _draw(cdf, ids, rng, size):
+    return ids[np.minimum(np.searchsorted(cdf, rng.random(size)), len(ids) - 1)]
+
+
+def generate_data(n_users=100000, n_items=20000, n_interactions=10000000, user_alpha=1.0, item_alpha=1.0,
+                  timestamps=True, play_counts=False, output="df", seed=42, chunk_size=DEFAULT_CHUNK_SIZE):
+    """Generate implicit feedback data with power-law user activity and item popularity.
+    Interactions are drawn independently: the user from a Zipf law of exponent user_alpha and the item from a
+    Zipf law of exponent item_alpha, over randomly permuted ids. Draws are made in chunks and accumulated in a
+    CSR matrix, so memory stays O(number of distinct pairs). Repeated draws of a pair are merged: the rating is
+    the number of draws with play_counts, and 1 without.
+
+    Args:
+        n_users (int): number of users.
+        n_items (int): number of items.
+        n_interactions (int): number of draws (up to 10^8), the number of distinct pairs is lower.
+        user_alpha (float): Zipf exponent of user activity.
+        item_alpha (float): Zipf exponent of item popularity.
+        timestamps (bool): if True, add a timestamp column (uniform random times), only for output="df".
+        play_counts (bool): if True, ratings are play counts, else 1.
+        output (str): "df" for a DataFrame with DEFAULT_HEADER columns, or "csr".
+        seed (int): random seed. The data is deterministic for a given seed and chunk_size.
+        chunk_size (int): number of draws at a time.
+
+    Returns:
+        pd.DataFrame or scipy.sparse.csr_matrix: DataFrame with int32 ids, float32 rating and int64 timestamp
+            (sorted by user and item, as the split functions return), or (n_users, n_items) float32 CSR matrix.
+    """
+    if output not in ("df", "csr"):
+        raise ValueError(ERROR_OUTPUT)
+
+    rng = np.random.default_rng(seed)
+    user_ids = rng.permutation(n_users).astype(np.int32)
+    item_ids = rng.permutation(n_items).astype(np.int32)
+    user_cdf, item_cdf = zipf_cdf(n_users, user_alpha), zipf_cdf(n_items, item_alpha)
+
+    counts = sp.csr_matrix((n_users, n_items), dtype=np.float32)
+    for start in range(0, n_interactions, chunk_size):
+        size = min(chunk_size, n_interactions - start)
+        users = _draw(user_cdf, user_ids, rng, size)
+        items = _draw(item_cdf, item_ids, rng, size)
+        counts = counts + sp.csr_matrix(
+            (np.ones(size, dtype=np.float32), (users, items)), shape=(n_users, n_items)
+        )
+    if not play_counts:
+        counts.data[:] = 1
+
+    if output == "csr":
+        return counts
+
+    header = DEFAULT_HEADER if timestamps else DEFAULT_HEADER[:3]
+    columns = [
+        np.repeat(np.arange(n_users, dtype=np.int32), np.diff(counts.indptr)),
+        counts.indices,
+        counts.data,
+    ]
+    if timestamps:
+        columns.append(rng.integers(START_TIME, END_TIME, size=counts.nnz, dtype=np.int64))
+    dtypes = rating_dtypes(header)
+    return pd.DataFrame({name: column.astype(dtypes[name], copy=False) for name, column in zip(header, columns)})
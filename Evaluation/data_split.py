@@ -1,10 +1,13 @@
 import math
-from tqdm import tqdm
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
 from tabulate import tabulate
-from sklearn.utils import shuffle
 from utils.common.constants import (
     DEFAULT_USER_COL,
     DEFAULT_ITEM_COL,
+    DEFAULT_RATING_COL,
     DEFAULT_TIMESTAMP_COL,
     DEFAULT_SPLIT_FLAG,
     DEFAULT_TEST_SIZE,
@@ -18,6 +21,13 @@ ERROR_SPLIT_STRATEGY = "Invalid split strategy. " \
 ERROR_TIMESTAMP_COL = ("This split strategy is available only for data with timestamp columns.\n"
                        "There is no timestamp column in this data. Only 'random_by_user' is available.\n")
 
+# train/val/test CSR matrices in one shared (user_ids, item_ids) index space, val is None without validation
+SparseSplit = namedtuple("SparseSplit", ["train", "val", "test", "user_ids", "item_ids"])
+# one cross-validation fold: row indices of data and CSR/CSC matrices in the shared (user_ids, item_ids) index space
+Fold = namedtuple("Fold", ["fold", "train_index", "test_index", "train", "train_csc", "test", "user_ids", "item_ids"])
+ERROR_N_FOLDS = "n_folds should be at least {}"
+ERROR_TRAIN_WINDOWS = "train_windows should be None or at least 1"
+
 
 def check_no_timestamp_col(data):
     return DEFAULT_TIMESTAMP_COL not in data.columns
@@ -33,18 +43,116 @@ def get_intersect(train, data_to_remove):
     Returns:
 
     """
-    user_pool = list(train[DEFAULT_USER_COL].unique())
-    item_pool = list(train[DEFAULT_ITEM_COL].unique())
+    user_pool = pd.Index(train[DEFAULT_USER_COL].unique())
+    item_pool = pd.Index(train[DEFAULT_ITEM_COL].unique())
 
     for data in data_to_remove:
-        data.drop(
-            data[~data[DEFAULT_USER_COL].isin(user_pool)].index,
-            inplace=True,
-        )
-        data.drop(
-            data[~data[DEFAULT_ITEM_COL].isin(item_pool)].index,
-            inplace=True,
-        )
+        known = (user_pool.get_indexer(data[DEFAULT_USER_COL]) >= 0) & \
+                (item_pool.get_indexer(data[DEFAULT_ITEM_COL]) >= 0)
+        data.drop(data.index[~known], inplace=True)
+
+
+def _encode_train_first(ids, is_train):
+    """Encode ids in order of first appearance, train rows first, so that train ids get the lowest codes.
+
+    Returns:
+        np.array, np.array, int: codes, unique ids and the number of ids seen in train
+    """
+    order = np.argsort(~is_train, kind="mergesort")
+    codes = np.empty(len(ids), dtype=np.int64)
+    codes[order], uniques = pd.factorize(ids[order])
+    n_train = codes[is_train].max() + 1 if is_train.any() else 0
+    return codes, np.asarray(uniques), n_train
+
+
+def _interaction_values(data):
+    """Values of the sparse matrices: ratings, or 1 without a rating column."""
+    if DEFAULT_RATING_COL in data.columns:
+        return data[DEFAULT_RATING_COL].to_numpy(dtype=np.float32)
+    return np.ones(len(data), dtype=np.float32)
+
+
+def _random_row_keys(data, random_state):
+    """One uniform random key per row, drawn in a canonical (user, item, timestamp) order
+    so that the keys do not depend on the row order of data.
+    """
+    sort_cols = [c for c in (DEFAULT_USER_COL, DEFAULT_ITEM_COL, DEFAULT_TIMESTAMP_COL) if c in data.columns]
+    canonical = data[sort_cols].reset_index(drop=True).sort_values(sort_cols, kind="mergesort").index
+    keys = np.empty(len(data))
+    keys[canonical.to_numpy()] = np.random.default_rng(random_state).random(len(data))
+    return keys
+
+
+def to_sparse_split(df_split, validation=False, intersect=True):
+    """Build the train/val/test partitions of a split labeled DataFrame as CSR matrices.
+    User and item ids are encoded once (pd.factorize) into a single index space shared by all partitions,
+    in order of first appearance in train then in the other rows, and each partition is selected with
+    one boolean mask.
+
+    Args:
+        df_split (DataFrame): split labeled DataFrame, e.g. split_data(..., intersect=False).
+        validation (bool): If True, build val. If False, val is None.
+        intersect (bool): if True, the index space holds the train ids only and val/test rows with
+            other ids are removed. If False, it holds the ids of all rows.
+
+    Returns:
+        SparseSplit: train, val, test (scipy.sparse.csr_matrix of ratings, or of 1 without a rating column),
+            user_ids and item_ids (raw ids of the rows and columns).
+    """
+    flags = df_split[DEFAULT_SPLIT_FLAG].to_numpy()
+    is_train = flags == 'train'
+    user_codes, user_ids, n_train_users = _encode_train_first(df_split[DEFAULT_USER_COL].to_numpy(), is_train)
+    item_codes, item_ids, n_train_items = _encode_train_first(df_split[DEFAULT_ITEM_COL].to_numpy(), is_train)
+    if intersect:
+        user_ids, item_ids = user_ids[:n_train_users], item_ids[:n_train_items]
+        user_codes[user_codes >= n_train_users] = -1
+        item_codes[item_codes >= n_train_items] = -1
+
+    values = _interaction_values(df_split)
+    known = (user_codes >= 0) & (item_codes >= 0)
+    shape = (len(user_ids), len(item_ids))
+
+    def partition(flag):
+        rows = known & (flags == flag)
+        return sp.csr_matrix((values[rows], (user_codes[rows], item_codes[rows])), shape=shape)
+
+    return SparseSplit(
+        train=partition('train'),
+        val=partition('val') if validation else None,
+        test=partition('test'),
+        user_ids=user_ids,
+        item_ids=item_ids,
+    )
+
+
+def user_split_flags(users, test_size, val_size, validation=False):
+    """Label train/val/test flags by position within each user, for rows already in split order.
+    The last ceil(user_size * test_size) rows of a user are test and the ceil(user_size * val_size) rows
+    before them are val, computed for all users at once from groupby cumcount and group sizes.
+
+    Args:
+        users (Series): user ids of the rows, in the order to split each user by (e.g. sorted by timestamp).
+        test_size (float): the proportion of each user's rows to include in the test split.
+        val_size (float): the proportion of each user's rows to include in the val split.
+        validation (bool): If True, label train/val/test. If False, label train/test.
+
+    Returns:
+        np.array: split flags of the rows
+    """
+    grouped = users.groupby(users, sort=False)
+    position = grouped.cumcount().to_numpy()
+    user_size = grouped.transform("size").to_numpy()
+
+    train_size = user_size - np.ceil(user_size * test_size)
+    flags = np.full(len(users), 'train', dtype=object)
+    flags[position >= train_size] = 'test'
+
+    if validation:
+        val_start = train_size - np.ceil(user_size * val_size)
+        # a negative start leaves no room for validation rows (an empty slice in per-user slicing)
+        flags[(val_start >= 0) & (position >= val_start) & (position < train_size)] = 'val'
+
+    return flags
 
 
 def leave_one_last(data, validation=False):
@@ -93,24 +201,11 @@ def temporal_user_split(data, test_size=DEFAULT_TEST_SIZE, val_size=DEFAULT_VAL_
         print(ERROR_TIMESTAMP_COL)
         return None
 
-    users = data[DEFAULT_USER_COL].unique()
     df_split = data.copy()
-    df_split[DEFAULT_SPLIT_FLAG] = 'train'
     df_split.sort_values(by=[DEFAULT_TIMESTAMP_COL], ascending=True, inplace=True)
-
-    for u in tqdm(users):
-        user_index = df_split[df_split[DEFAULT_USER_COL] == u].index.values
-        user_size = len(user_index)
-        test_split_size = math.ceil(user_size * test_size)
-        train_size = user_size - test_split_size
-
-        df_split.loc[user_index[train_size:], DEFAULT_SPLIT_FLAG] = 'test'
-
-        if validation:
-            val_split_size = math.ceil(user_size * val_size)
-            df_split.loc[
-                user_index[(train_size - val_split_size): train_size], DEFAULT_SPLIT_FLAG
-            ] = 'val'
+    df_split[DEFAULT_SPLIT_FLAG] = user_split_flags(
+        df_split[DEFAULT_USER_COL], test_size, val_size, validation
+    )
 
     df_split = df_split.sort_values([DEFAULT_USER_COL, DEFAULT_ITEM_COL]).reset_index(drop=True)
 
@@ -166,31 +261,21 @@ def random_split_by_user(data, test_size=DEFAULT_TEST_SIZE, val_size=DEFAULT_VAL
         test_size (float): the proportion of the dataset to include in the test split.
         val_size (float): the proportion of the dataset to include in the val split.
         validation (bool): Default False. If True, split train/val/test. If False, split train/test.
-        random_state (int): random seed.
+        random_state (int): random seed. The split is deterministic for a given seed, whatever the row order.
 
     Returns:
         DataFrame: split labeled DataFrame (split_flag = train/val/test)
     """
 
-    users = data[DEFAULT_USER_COL].unique()
     df_split = data.copy()
-    df_split[DEFAULT_SPLIT_FLAG] = 'train'
+    keys = _random_row_keys(df_split, random_state)
 
-    for u in tqdm(users):
-        user_index = df_split[df_split[DEFAULT_USER_COL] == u].index.values
-        user_index = shuffle(user_index, random_state=random_state)
-
-        user_size = len(user_index)
-        test_split_size = math.ceil(user_size * test_size)
-        train_size = user_size - test_split_size
-
-        df_split.loc[user_index[train_size:], DEFAULT_SPLIT_FLAG] = 'test'
-
-        if validation:
-            val_split_size = math.ceil(user_size * val_size)
-            df_split.loc[
-                user_index[(train_size - val_split_size):train_size], DEFAULT_SPLIT_FLAG
-            ] = 'val'
+    # rank rows within each user by their key, then split each user by position
+    user_codes, _ = pd.factorize(df_split[DEFAULT_USER_COL])
+    order = np.lexsort((keys, user_codes))
+    flags = np.empty(len(df_split), dtype=object)
+    flags[order] = user_split_flags(pd.Series(user_codes[order]), test_size, val_size, validation)
+    df_split[DEFAULT_SPLIT_FLAG] = flags
 
     df_split = df_split.sort_values([DEFAULT_USER_COL, DEFAULT_ITEM_COL]).reset_index(drop=True)
 
@@ -235,30 +320,132 @@ def split_data(data, split_strategy='leave_one_last',
     if not intersect:
         return df_split
 
-    train = df_split[df_split[DEFAULT_SPLIT_FLAG] == 'train'].drop(
-        DEFAULT_SPLIT_FLAG,
-        axis=1
-    )
-    test = df_split[df_split[DEFAULT_SPLIT_FLAG] == 'test'].drop(
-        DEFAULT_SPLIT_FLAG,
-        axis=1
+    return partition_split(df_split, validation)
+
+
+def partition_split(df_split, validation=False):
+    """Select the train/val/test DataFrames of a split labeled DataFrame, keeping the ids in train.
+    This is the last step of split_data, for callers that label the rows themselves (e.g. the split cache).
+
+    Args:
+        df_split (DataFrame): data with a DEFAULT_SPLIT_FLAG column of "train", "val" or "test".
+        validation (bool): If True, return train/val/test. If False, return train/test.
+
+    Returns:
+        DataFrame : train, (val,) test DataFrames without the flag column, val/test rows of unknown ids removed.
+    """
+    flags = df_split[DEFAULT_SPLIT_FLAG]
+    train, val, test = (
+        df_split[flags == flag].drop(DEFAULT_SPLIT_FLAG, axis=1) for flag in ('train', 'val', 'test')
     )
 
     if validation:
-        val = df_split[df_split[DEFAULT_SPLIT_FLAG] == 'val'].drop(
-            DEFAULT_SPLIT_FLAG,
-            axis=1
-        )
-        if intersect:
-            get_intersect(train, [test, val])
+        get_intersect(train, [test, val])
         return train, val, test
 
-    else:
+    get_intersect(train, [test])
+    return train, test
+
+
+def _iter_folds(data, fold_ids, n_folds, intersect, rolling=False, train_windows=None):
+    """Yield the folds of rows labeled with fold ids, one at a time.
+    If rolling is False, fold k tests on the rows of fold id k and trains on all other rows.
+    Otherwise fold ids are time windows: fold k tests on window k + 1 and trains on the train_windows
+    windows before it, or on all windows before it when train_windows is None.
+    """
+    user_codes, user_ids = pd.factorize(data[DEFAULT_USER_COL])
+    item_codes, item_ids = pd.factorize(data[DEFAULT_ITEM_COL])
+    user_ids, item_ids = np.asarray(user_ids), np.asarray(item_ids)
+    values = _interaction_values(data)
+    shape = (len(user_ids), len(item_ids))
+
+    for k in range(n_folds):
+        if not rolling:
+            is_test = fold_ids == k
+            train_index, test_index = np.flatnonzero(~is_test), np.flatnonzero(is_test)
+        else:
+            train_start = 0 if train_windows is None else max(k + 1 - train_windows, 0)
+            train_index = np.flatnonzero((fold_ids >= train_start) & (fold_ids <= k))
+            test_index = np.flatnonzero(fold_ids == k + 1)
+
+        train = sp.csr_matrix(
+            (values[train_index], (user_codes[train_index], item_codes[train_index])), shape=shape
+        )
         if intersect:
-            get_intersect(train, [test])
-        return train, test
+            in_train_users = np.diff(train.indptr) > 0
+            in_train_items = np.bincount(train.indices, minlength=shape[1]) > 0
+            test_index = test_index[in_train_users[user_codes[test_index]] & in_train_items[item_codes[test_index]]]
+        test = sp.csr_matrix(
+            (values[test_index], (user_codes[test_index], item_codes[test_index])), shape=shape
+        )
 
+        yield Fold(k, train_index, test_index, train, train.tocsc(), test, user_ids, item_ids)
 
 
+def kfold_user_split(data, n_folds=5, random_state=None, intersect=True):
+    """Lazy user-stratified K-fold cross-validation.
+    Every user's rows are shuffled and dealt round-robin over the folds (from a random first fold per user),
+    so each fold tests on about 1/n_folds of every user's rows. Fold ids are computed once; the index arrays
+    and matrices of a fold are built only when it is reached, so one fold is materialized at a time.
+
+    Args:
+        data (DataFrame): data to split.
+        n_folds (int): number of folds.
+        random_state (int): random seed. The folds are deterministic for a given seed, whatever the row order.
+        intersect (bool): if True, test rows whose user or item is not in the fold's train are left out.
+
+    Returns:
+        generator: Fold(fold, train_index, test_index, train, train_csc, test, user_ids, item_ids)
+            for each fold. train_index/test_index are row positions in data, train/test are
+            scipy.sparse.csr_matrix and train_csc is scipy.sparse.csc_matrix, all in one shared
+            (user_ids, item_ids) index space.
+    """
+    if n_folds < 2:
+        raise ValueError(ERROR_N_FOLDS.format(2))
+
+    rng = np.random.default_rng(random_state)
+    keys = _random_row_keys(data, rng)
+    # sorted codes, so that the first fold drawn for each user does not depend on the row order either
+    user_codes, user_ids = pd.factorize(data[DEFAULT_USER_COL], sort=True)
+
+    # position of each row within its user, in random key order
+    order = np.lexsort((keys, user_codes))
+    position = np.empty(len(data), dtype=np.int64)
+    position[order] = pd.Series(user_codes[order]).groupby(user_codes[order]).cumcount().to_numpy()
+    first_fold = rng.integers(0, n_folds, size=len(user_ids))
+    fold_ids = (position + first_fold[user_codes]) % n_folds
+
+    return _iter_folds(data, fold_ids, n_folds, intersect)
+
+
+def rolling_temporal_split(data, n_folds=5, train_windows=None, intersect=True):
+    """Lazy rolling-window temporal cross-validation.
+    The timeline is cut into n_folds + 1 consecutive windows holding about the same number of rows
+    (rows with the same timestamp stay in the same window). Fold k tests on window k + 1 and trains on the
+    `train_windows` windows before it, or on all earlier windows when train_windows is None (expanding window).
+    One fold is materialized at a time.
+
+    Args:
+        data (DataFrame): data to split, with a timestamp column.
+        n_folds (int): number of folds.
+        train_windows (int): number of windows to train on, at least 1. If None, all earlier windows.
+        intersect (bool): if True, test rows whose user or item is not in the fold's train are left out.
+
+    Returns:
+        generator: Fold(fold, train_index, test_index, train, train_csc, test, user_ids, item_ids)
+            for each fold, see kfold_user_split. None if data has no timestamp column.
+    """
+    if check_no_timestamp_col(data):
+        print(ERROR_TIMESTAMP_COL)
+        return None
+    if n_folds < 1:
+        raise ValueError(ERROR_N_FOLDS.format(1))
+    if train_windows is not None and train_windows < 1:
+        raise ValueError(ERROR_TRAIN_WINDOWS)
 
+    timestamps = data[DEFAULT_TIMESTAMP_COL].to_numpy()
+    sorted_timestamps = np.sort(timestamps)
+    bounds = sorted_timestamps[(np.arange(1, n_folds + 1) * len(data)) // (n_folds + 1)]
+    fold_ids = np.searchsorted(bounds, timestamps, side="right")
 
+    return _iter_folds(data, fold_ids, n_folds, intersect, rolling=True, train_windows=train_windows)
@@ -0,0 +1,441 @@
+from collections import namedtuple
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from scipy.stats import rankdata
+from utils.common.constants import (
+    DEFAULT_USER_COL,
+    DEFAULT_ITEM_COL,
+)
+from Evaluation.ranking_metrics import TOP_K_ERROR
+from WRMF.wrmf_utils import id_array
+
+ERROR_METRIC = "Invalid metric {}. Should be one of {}"
+ERROR_N_ITEMS = "Catalog metrics {} need n_items, the catalog size (e.g. train_set.num_items)"
+
+EvaluationResult = namedtuple("EvaluationResult", ["means", "per_user", "users"])
+
+# (DCG discounts, ideal DCG) of ranks 1..n, grown on demand and shared by every call
+_DCG_CACHE = (np.zeros(0), np.zeros(1))
+
+
+def to_sparse_inputs(top_k_recommend, user_item_ids):
+    """Encode the inputs of the ranking_metrics functions into a shared user/item index space.
+
+    Args:
+        top_k_recommend (DataFrame): top-k recommendation pivot table (index=user, columns=rank) from recommend_top_k.
+        user_item_ids (DataFrame): ground truth user-item pairs, e.g. test data.
+
+    Returns:
+        (np.array, scipy.sparse.csr_matrix): (n_users, k) int recommendation matrix (-1 for missing items) and
+            (n_users, n_items) relevance matrix counting ground truth rows of each user-item pair.
+            Rows follow the order of user_item_ids[DEFAULT_USER_COL].unique().
+    """
+    user_codes, users = pd.factorize(user_item_ids[DEFAULT_USER_COL])
+    truth_items = user_item_ids[DEFAULT_ITEM_COL].to_numpy()
+    recommend = top_k_recommend.reindex(users).to_numpy()
+
+    item_codes, items = pd.factorize(np.concatenate([truth_items, recommend.ravel()]))
+    recommendations = item_codes[len(truth_items):].reshape(recommend.shape)
+
+    relevance = sp.csr_matrix(
+        (np.ones(len(truth_items)), (user_codes, item_codes[:len(truth_items)])),
+        shape=(len(users), len(items)),
+    )
+    return recommendations, relevance
+
+
+def relevance_from_df(data, uid_map, iid_map):
+    """Build a relevance matrix in the index space of a trained model.
+    Rows of users or items unknown to the model are dropped.
+
+    Args:
+        data (DataFrame): ground truth user-item pairs, e.g. test data.
+        uid_map (dict): raw user id to index mapping, e.g. model.train_set.uid_map.
+        iid_map (dict): raw item id to index mapping, e.g. model.train_set.iid_map.
+
+    Returns:
+        scipy.sparse.csr_matrix: (len(uid_map), len(iid_map)) relevance matrix counting ground truth rows.
+    """
+    user_idx = pd.Index(id_array(uid_map)).get_indexer(data[DEFAULT_USER_COL])
+    item_idx = pd.Index(id_array(iid_map)).get_indexer(data[DEFAULT_ITEM_COL])
+    known = (user_idx >= 0) & (item_idx >= 0)
+    relevance = sp.csr_matrix(
+        (np.ones(known.sum()), (user_idx[known], item_idx[known])),
+        shape=(len(uid_map), len(iid_map)),
+    )
+    relevance.sum_duplicates()
+    return relevance
+
+
+def get_hits(recommendations, relevance, block_size=65536):
+    """Look up the relevance of every recommended item.
+    Each (user, item) pair is turned into a key `user * n_items + item`. The keys of the CSR entries are
+    sorted, so all recommended items of a block of users are looked up at once with a single searchsorted.
+
+    Args:
+        recommendations (np.array): (n_users, k) recommended item indices, negative for missing items.
+        relevance (scipy.sparse.csr_matrix): (n_users, n_items) relevance matrix.
+        block_size (int): number of users looked up at a time, bounds the int64 temporaries.
+
+    Returns:
+        np.array: (n_users, k) relevance of the recommended items, 0 for misses.
+    """
+    relevance = sp.csr_matrix(relevance)
+    relevance.sum_duplicates()
+    n_users, n_items = relevance.shape
+
+    rows = np.repeat(np.arange(n_users, dtype=np.int64), np.diff(relevance.indptr))
+    keys = rows * n_items + relevance.indices
+
+    hits = np.zeros(np.shape(recommendations), dtype=relevance.dtype)
+    if len(keys) == 0:
+        return hits
+
+    for start in range(0, n_users, block_size):
+        block = np.asarray(recommendations[start:start + block_size], dtype=np.int64)
+        valid = (block >= 0) & (block < n_items)
+        queries = np.arange(start, start + len(block), dtype=np.int64)[:, None] * n_items + block
+        pos = np.minimum(np.searchsorted(keys, queries), len(keys) - 1)
+        found = valid & (keys[pos] == queries)
+        hits[start:start + len(block)][found] = relevance.data[pos[found]]
+    return hits
+
+
+def _dcg_tables(k):
+    """Return the cached (discounts, idcg) tables covering k ranks, grown if needed.
+    Both tables are swapped in as one tuple, so concurrent readers never see a mismatched pair."""
+    global _DCG_CACHE
+    tables = _DCG_CACHE
+    if len(tables[0]) < k:
+        discounts = 1 / np.log2(np.arange(k) + 2)
+        # ideal DCG of n relevant items is the sum of the first n discounts
+        idcg = np.array([np.sum(discounts[:n]) for n in range(k + 1)])
+        tables = _DCG_CACHE = (discounts, idcg)
+    return tables
+
+
+def dcg_discounts(k):
+    """Return the DCG discounts 1 / log2(rank + 1) of ranks 1..k."""
+    return _dcg_tables(k)[0][:k]
+
+
+def idcg_table(k):
+    """Return the ideal DCG of 0..k relevant items, idcg_table(k)[n] = sum of the first n discounts."""
+    return _dcg_tables(k)[1][:k + 1]
+
+
+def _check_k(recommendations, k):
+    top_k = recommendations.shape[1]
+    if k is None:
+        return top_k
+    elif top_k < k:
+        print(TOP_K_ERROR)
+        return None
+    return k
+
+
+def _n_relevant(relevance):
+    return np.asarray(relevance.sum(axis=1)).ravel()
+
+
+def sparse_precision_at_k(recommendations, relevance, k=None, hits=None):
+    """Precision@k from a recommendation matrix and a relevance matrix.
+    Users without relevant items are left out, like users not in the ground truth of precision_at_k.
+
+    Args:
+        recommendations (np.array): (n_users, top_k) recommended item indices, negative for missing items.
+        relevance (scipy.sparse.csr_matrix): (n_users, n_items) relevance matrix.
+        k (int): cutoff. If None, top_k of the recommendations.
+        hits (np.array): precomputed get_hits(recommendations, relevance).
+
+    Returns:
+        float: mean Precision@k
+    """
+    k = _check_k(recommendations, k)
+    if k is None:
+        return None
+    if hits is None:
+        hits = get_hits(recommendations, relevance)
+    n_relevant = _n_relevant(relevance)
+    users = n_relevant > 0
+    return _precision(hits[users], n_relevant[users], k).mean()
+
+
+def sparse_recall_at_k(recommendations, relevance, k=None, hits=None):
+    """Recall@k from a recommendation matrix and a relevance matrix.
+
+    Args:
+        recommendations (np.array): (n_users, top_k) recommended item indices, negative for missing items.
+        relevance (scipy.sparse.csr_matrix): (n_users, n_items) relevance matrix.
+        k (int): cutoff. If None, top_k of the recommendations.
+        hits (np.array): precomputed get_hits(recommendations, relevance).
+
+    Returns:
+        float: mean Recall@k
+    """
+    k = _check_k(recommendations, k)
+    if k is None:
+        return None
+    if hits is None:
+        hits = get_hits(recommendations, relevance)
+    n_relevant = _n_relevant(relevance)
+    users = n_relevant > 0
+    return _recall(hits[users], n_relevant[users], k).mean()
+
+
+def sparse_ndcg_at_k(recommendations, relevance, k=None, hits=None):
+    """NDCG@k (binary relevance) from a recommendation matrix and a relevance matrix.
+
+    Args:
+        recommendations (np.array): (n_users, top_k) recommended item indices, negative for missing items.
+        relevance (scipy.sparse.csr_matrix): (n_users, n_items) relevance matrix.
+        k (int): cutoff. If None, top_k of the recommendations.
+        hits (np.array): precomputed get_hits(recommendations, relevance).
+
+    Returns:
+        float: mean NDCG@k
+    """
+    k = _check_k(recommendations, k)
+    if k is None:
+        return None
+    if hits is None:
+        hits = get_hits(recommendations, relevance)
+    n_relevant = _n_relevant(relevance)
+    users = n_relevant > 0
+    return _ndcg(hits[users], n_relevant[users], k).mean()
+
+
+def _precision(hits, n_relevant, k):
+    return hits[:, :k].sum(axis=1) / k
+
+
+def _recall(hits, n_relevant, k):
+    return hits[:, :k].sum(axis=1) / n_relevant
+
+
+def _ndcg(hits, n_relevant, k):
+    dcg = np.sum((hits[:, :k] > 0) * dcg_discounts(k), axis=1)
+    return dcg / idcg_table(k)[np.minimum(n_relevant, k).astype(np.int64)]
+
+
+def _map(hits, n_relevant, k):
+    relevant = hits[:, :k] > 0
+    precisions = np.cumsum(relevant, axis=1) / np.arange(1, relevant.shape[1] + 1)
+    return np.sum(precisions * relevant, axis=1) / np.minimum(n_relevant, k)
+
+
+def _mrr(hits, n_relevant, k):
+    relevant = hits[:, :k] > 0
+    first_hit = relevant.argmax(axis=1)
+    return np.where(relevant.any(axis=1), 1 / (first_hit + 1), 0.0)
+
+
+def _hit_rate(hits, n_relevant, k):
+    return (hits[:, :k] > 0).any(axis=1).astype(np.float64)
+
+
+# per-user metric kernels: kernel(hits, n_relevant, k) -> (n_users, ) array
+METRIC_KERNELS = {
+    "precision": ("Precision@{}", _precision),
+    "recall": ("Recall@{}", _recall),
+    "ndcg": ("NDCG@{}", _ndcg),
+    "map": ("MAP@{}", _map),
+    "mrr": ("MRR@{}", _mrr),
+    "hit_rate": ("HitRate@{}", _hit_rate),
+}
+
+
+def recommendation_counts(recommendations, n_items, k=None):
+    """Return how often each catalog item is recommended in the top-k lists.
+
+    Args:
+        recommendations (np.array): (n_users, top_k) recommended item indices, negative for missing items.
+        n_items (int): catalog size.
+        k (int): cutoff. If None, top_k of the recommendations.
+
+    Returns:
+        np.array: (n_items, ) recommendation counts
+    """
+    recommended = recommendations[:, :k].ravel()
+    return np.bincount(recommended[recommended >= 0], minlength=n_items)
+
+
+def coverage_from_counts(counts):
+    """Catalog coverage from recommendation_counts."""
+    return np.count_nonzero(counts) / len(counts)
+
+
+def gini_from_counts(counts):
+    """Gini index from recommendation_counts."""
+    counts = np.sort(counts)
+    if counts.sum() == 0:
+        return 0.0
+    n_items = len(counts)
+    index = np.arange(1, n_items + 1)
+    return np.sum((2 * index - n_items - 1) * counts) / (n_items * counts.sum())
+
+
+def catalog_coverage(recommendations, n_items, k=None):
+    """Fraction of the catalog recommended to at least one user.
+
+    Args:
+        recommendations (np.array): (n_users, top_k) recommended item indices, negative for missing items.
+        n_items (int): catalog size.
+        k (int): cutoff. If None, top_k of the recommendations.
+
+    Returns:
+        float: catalog coverage
+    """
+    return coverage_from_counts(recommendation_counts(recommendations, n_items, k))
+
+
+def gini_index(recommendations, n_items, k=None):
+    """Gini index of how often each catalog item is recommended. 0 is perfectly even, 1 is one item for everyone.
+
+    Args:
+        recommendations (np.array): (n_users, top_k) recommended item indices, negative for missing items.
+        n_items (int): catalog size.
+        k (int): cutoff. If None, top_k of the recommendations.
+
+    Returns:
+        float: Gini index
+    """
+    return gini_from_counts(recommendation_counts(recommendations, n_items, k))
+
+
+# catalog-level metrics: metric(recommendations, n_items, k) -> scalar, and the same metric from merged counts
+CATALOG_METRICS = {
+    "coverage": ("Coverage@{}", catalog_coverage),
+    "gini": ("Gini@{}", gini_index),
+}
+CATALOG_METRICS_FROM_COUNTS = {
+    "coverage": coverage_from_counts,
+    "gini": gini_from_counts,
+}
+
+
+def full_auc(scores, relevance, exclude=None):
+    """AUC of every user over the full catalog, from the ranks of the relevant items (Mann-Whitney U).
+    Tied scores count as half-correct pairs.
+
+    Args:
+        scores (np.array): (n_users, n_items) scores of a block of users.
+        relevance (scipy.sparse.csr_matrix): (n_users, n_items) relevance rows of the same users.
+        exclude (scipy.sparse.csr_matrix): (n_users, n_items) items left out of the ranking, e.g. training items.
+
+    Returns:
+        np.array: (n_users, ) AUC, NaN for users without relevant or without negative items.
+    """
+    scores = np.array(scores, dtype=np.float64)
+    positive = sp.csr_matrix(relevance).toarray() > 0
+    n_excluded = np.zeros(scores.shape[0])
+    if exclude is not None:
+        excluded = (sp.csr_matrix(exclude).toarray() > 0) & ~positive
+        n_excluded = excluded.sum(axis=1)
+        # excluded items rank below every candidate, so each positive rank moves up by n_excluded
+        scores[excluded] = -np.inf
+
+    ranks = rankdata(scores, axis=1)
+    n_pos = positive.sum(axis=1)
+    n_neg = scores.shape[1] - n_pos - n_excluded
+    rank_sum = np.sum(ranks * positive, axis=1) - n_pos * n_excluded
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (rank_sum - n_pos * (n_pos + 1) / 2) / (n_pos * n_neg)
+
+
+def sampled_auc(pos_scores, neg_scores, pos_mask=None):
+    """AUC of every user against sampled negative items.
+
+    Args:
+        pos_scores (np.array): (n_users, n_pos) scores of relevant items.
+        neg_scores (np.array): (n_users, n_neg) scores of sampled negative items.
+        pos_mask (np.array): (n_users, n_pos) boolean mask of valid pos_scores entries. If None, all are valid.
+
+    Returns:
+        np.array: (n_users, ) AUC, NaN for users without relevant items.
+    """
+    pos_scores = np.array(pos_scores, dtype=np.float64)
+    if pos_mask is None:
+        pos_mask = np.ones(pos_scores.shape, dtype=bool)
+    n_padding = (~pos_mask).sum(axis=1)
+    # padding ranks below everything, so each valid positive rank moves up by n_padding
+    pos_scores[~pos_mask] = -np.inf
+
+    ranks = rankdata(np.concatenate([pos_scores, neg_scores], axis=1), axis=1)[:, :pos_scores.shape[1]]
+    n_pos = pos_mask.sum(axis=1)
+    rank_sum = np.sum(ranks * pos_mask, axis=1) - n_pos * n_padding
+    with np.errstate(divide="ignore", invalid="ignore"):
+        return (rank_sum - n_pos * (n_pos + 1) / 2) / (n_pos * neg_scores.shape[1])
+
+
+class RankingEvaluator:
+    """Compute several ranking metrics at several cutoffs in a single pass.
+    The hit matrix is computed once per call and every metric is derived from it.
+
+    Args:
+        metrics (list or tuple): metric names, keys of METRIC_KERNELS or CATALOG_METRICS.
+        k_list (list or tuple): cutoffs, e.g. (5, 10, 20, 100).
+    """
+
+    def __init__(self, metrics=("precision", "recall", "ndcg"), k_list=(10,)):
+        for metric in metrics:
+            if metric not in METRIC_KERNELS and metric not in CATALOG_METRICS:
+                raise ValueError(ERROR_METRIC.format(metric, tuple(METRIC_KERNELS) + tuple(CATALOG_METRICS)))
+        self.metrics = metrics
+        self.k_list = sorted(k_list)
+        # warm the discount tables up to the largest cutoff
+        dcg_discounts(self.k_list[-1])
+
+    def evaluate(self, recommendations, relevance, n_items=None):
+        """Evaluate a recommendation matrix against a relevance matrix.
+
+        Args:
+            recommendations (np.array): (n_users, top_k) recommended item indices, negative for missing items.
+            relevance (scipy.sparse.csr_matrix): (n_users, n_items) relevance matrix.
+            n_items (int): catalog size, required for catalog metrics. relevance.shape[1] is not used as a
+                default, since a relevance matrix from to_sparse_inputs only spans the evaluated items.
+
+        Returns:
+            EvaluationResult: means (dict), per_user (dict of (n_evaluated, ) arrays) and
+                users (indices of the evaluated rows, users with at least one relevant item).
+                Catalog metrics are computed over all rows and only reported in means.
+        """
+        catalog_metrics = [m for m in self.metrics if m in CATALOG_METRICS]
+        if catalog_metrics and n_items is None:
+            raise ValueError(ERROR_N_ITEMS.format(catalog_metrics))
+        if _check_k(recommendations, self.k_list[-1]) is None:
+            return None
+
+        n_relevant = _n_relevant(relevance)
+        users = np.flatnonzero(n_relevant > 0)
+        hits = get_hits(recommendations, relevance)[users]
+        result = self.evaluate_hits(hits, n_relevant[users], users)
+
+        for metric in catalog_metrics:
+            name, catalog_metric = CATALOG_METRICS[metric]
+            for k in self.k_list:
+                result.means[name.format(k)] = catalog_metric(recommendations, n_items, k)
+        return result
+
+    def evaluate_hits(self, hits, n_relevant, users=None):
+        """Derive every metric from a precomputed hit matrix.
+
+        Args:
+            hits (np.array): (n_users, top_k) relevance of the recommended items, 0 for misses.
+            n_relevant (np.array): (n_users, ) number of relevant items of each user.
+            users (np.array): user indices of the hits rows.
+
+        Returns:
+            EvaluationResult: means, per_user and users
+        """
+        per_user = {}
+        for metric in self.metrics:
+            if metric not in METRIC_KERNELS:
+                continue
+            name, kernel = METRIC_KERNELS[metric]
+            for k in self.k_list:
+                per_user[name.format(k)] = kernel(hits, n_relevant, k)
+
+        means = {name: values.mean() for name, values in per_user.items()}
+        return EvaluationResult(means, per_user, users)
@@ -0,0 +1,247 @@
+import os
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import shared_memory
+import numpy as np
+import scipy.sparse as sp
+from WRMF.wrmf_utils import mask_seen_items, top_k_scores
+from Evaluation.fast_ranking_metrics import (
+    RankingEvaluator, EvaluationResult, CATALOG_METRICS, CATALOG_METRICS_FROM_COUNTS,
+    relevance_from_df, get_hits, recommendation_counts, full_auc,
+)
+
+ERROR_N_JOBS = "Invalid n_jobs {}. Should be a positive number of processes or -1 for all cores"
+# arrays of the evaluation task, set once per worker process
+_WORKER_STATE = {}
+
+
+class _SharedArrays:
+    """Copies numpy arrays into named shared memory blocks that worker processes attach to"""
+
+    def __init__(self, arrays):
+        self.blocks = []
+        self.specs = {}
+        for name, array in arrays.items():
+            array = np.ascontiguousarray(array)
+            block = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+            np.ndarray(array.shape, dtype=array.dtype, buffer=block.buf)[...] = array
+            self.blocks.append(block)
+            self.specs[name] = (block.name, array.shape, array.dtype.str)
+
+    def close(self):
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+
+
+def _attach(specs):
+    blocks, arrays = [], {}
+    for name, (block_name, shape, dtype) in specs.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        arrays[name] = np.ndarray(shape, dtype=dtype, buffer=block.buf)
+    # keep the blocks referenced for the lifetime of the worker
+    arrays["_blocks"] = blocks
+    return arrays
+
+
+def _init_worker(specs, options):
+    _WORKER_STATE.update(_attach(specs))
+    _WORKER_STATE.update(options)
+
+
+def _csr(arrays, prefix, shape):
+    return sp.csr_matrix(
+        (arrays[prefix + "_data"], arrays[prefix + "_indices"], arrays[prefix + "_indptr"]), shape=shape
+    )
+
+
+def evaluate_block(scores, block_users, relevance, seen, evaluator, counts, auc=False):
+    """Compute the metric contributions of one block of scores. The scores are modified in place.
+
+    Args:
+        scores (np.array): (len(block_users), n_items) scores of the block.
+        block_users (np.array): user indices of the block.
+        relevance (scipy.sparse.csr_matrix): (n_users, n_items) test relevance.
+        seen (scipy.sparse.csr_matrix): (n_users, n_items) items to remove from the recommendations, or None.
+        evaluator (RankingEvaluator): evaluator with the metrics and cutoffs.
+        counts (dict): recommendation counts of catalog metrics by cutoff, updated in place.
+        auc (bool): if True, also compute the full-catalog AUC of every user.
+
+    Returns:
+        dict: per-user metric arrays of the block.
+    """
+    block_relevance = relevance[block_users]
+    block_seen = None if seen is None else seen[block_users]
+
+    auc_values = full_auc(scores, block_relevance, block_seen) if auc else None
+    if block_seen is not None:
+        mask_seen_items(scores, block_seen, slice(None))
+    recommendations, _ = top_k_scores(scores, max(evaluator.k_list))
+
+    hits = get_hits(recommendations, block_relevance)
+    n_relevant = np.asarray(block_relevance.sum(axis=1)).ravel()
+    per_user = evaluator.evaluate_hits(hits, n_relevant).per_user
+    if auc:
+        per_user["AUC"] = auc_values
+    for k in counts:
+        counts[k] += recommendation_counts(recommendations, scores.shape[1], k)
+    return per_user
+
+
+def merge_blocks(blocks, counts, catalog_metrics, users):
+    """Merge the per-block results of evaluate_block into an EvaluationResult.
+
+    Args:
+        blocks (list): per-user metric dicts of the blocks, in user order.
+        counts (dict): recommendation counts of catalog metrics by cutoff.
+        catalog_metrics (list): catalog metric names.
+        users (np.array): user indices of the per-user arrays.
+
+    Returns:
+        EvaluationResult: means, per_user and users
+    """
+    per_user = {name: np.concatenate([block[name] for block in blocks]) for name in blocks[0]} if blocks else {}
+    means = {name: np.nanmean(values) if name == "AUC" else values.mean() for name, values in per_user.items()}
+
+    for metric in catalog_metrics:
+        name, _ = CATALOG_METRICS[metric]
+        for k, k_counts in counts.items():
+            means[name.format(k)] = CATALOG_METRICS_FROM_COUNTS[metric](k_counts)
+
+    return EvaluationResult(means, per_user, users)
+
+
+def catalog_counts(catalog_metrics, k_list, n_items):
+    """Return empty recommendation counts by cutoff, {} when no catalog metric is requested."""
+    return {k: np.zeros(n_items, dtype=np.int64) for k in k_list} if catalog_metrics else {}
+
+
+def _evaluate_shard(users):
+    state = _WORKER_STATE
+    U, V = state["U"], state["V"]
+    shape = (U.shape[0], V.shape[0])
+    relevance = _csr(state, "relevance", shape)
+    seen = _csr(state, "seen", shape) if state["remove_seen"] else None
+
+    evaluator = RankingEvaluator(metrics=state["metrics"], k_list=state["k_list"])
+    counts = catalog_counts(state["catalog_metrics"], state["k_list"], shape[1])
+
+    per_user = []
+    for start in range(0, len(users), state["block_size"]):
+        block_users = users[start:start + state["block_size"]]
+        scores = U[block_users].dot(V.T)
+        per_user.append(evaluate_block(scores, block_users, relevance, seen, evaluator, counts))
+
+    return per_user, counts
+
+
+def test_relevance(model, test):
+    """Return the test relevance matrix in the model index space from test data or a relevance matrix."""
+    if sp.issparse(test):
+        relevance = sp.csr_matrix(test)
+        relevance.sum_duplicates()
+        return relevance
+    return relevance_from_df(test, model.train_set.uid_map, model.train_set.iid_map)
+
+
+def evaluate(model, test, k=10, metrics=("precision", "recall", "ndcg"), k_list=None, n_jobs=1,
+             block_size=1024, remove_seen=True):
+    """Evaluate a trained factor model on test data, sharding the users across worker processes.
+    Users with test items are split into `n_jobs` contiguous shards. Each worker attaches to U, V and the
+    seen/test CSR arrays in shared memory, scores its shard block by block, and returns per-user metric
+    arrays (and recommendation counts for catalog metrics). Partial results are merged in shard order,
+    so means and per-user arrays are exactly the ones of the serial run.
+
+    Args:
+        model (WRMF.wrmf.WRMF): trained model with U, V and its train_set.
+        test (DataFrame or scipy.sparse.csr_matrix): test data, or its relevance matrix in the model index space.
+        k (int): cutoff, used when k_list is None.
+        metrics (list or tuple): metric names, keys of METRIC_KERNELS or CATALOG_METRICS.
+        k_list (list or tuple): cutoffs. If None, (k,).
+        n_jobs (int): number of worker processes. 1 runs in the current process, -1 uses all cores.
+        block_size (int): number of users scored at a time by a worker.
+        remove_seen (bool): flag to remove items seen in the training data from the recommendations.
+
+    Returns:
+        EvaluationResult: means, per_user and users (model user indices of the per-user arrays).
+    """
+    k_list = sorted((k,) if k_list is None else k_list)
+    if n_jobs == -1:
+        n_jobs = os.cpu_count() or 1
+    elif n_jobs < 1:
+        raise ValueError(ERROR_N_JOBS.format(n_jobs))
+
+    relevance = test_relevance(model, test)
+    U, V = model.get_factors()
+    users = np.flatnonzero(np.diff(relevance.indptr) > 0)
+
+    arrays = {
+        "U": U, "V": V,
+        "relevance_data": relevance.data, "relevance_indices": relevance.indices,
+        "relevance_indptr": relevance.indptr,
+    }
+    if remove_seen:
+        seen = sp.csr_matrix(model.train_set.csr_matrix)
+        arrays.update(seen_data=seen.data, seen_indices=seen.indices, seen_indptr=seen.indptr)
+    options = {
+        "metrics": metrics, "k_list": k_list, "block_size": block_size, "remove_seen": remove_seen,
+        "catalog_metrics": [m for m in metrics if m in CATALOG_METRICS],
+    }
+    shards = [shard for shard in np.array_split(users, n_jobs) if len(shard) > 0]
+
+    if n_jobs == 1:
+        _WORKER_STATE.clear()
+        _WORKER_STATE.update(arrays)
+        _WORKER_STATE.update(options)
+        try:
+            partials = [_evaluate_shard(shard) for shard in shards]
+        finally:
+            _WORKER_STATE.clear()
+    else:
+        shared = _SharedArrays(arrays)
+        try:
+            with ProcessPoolExecutor(max_workers=n_jobs, initializer=_init_worker,
+                                     initargs=(shared.specs, options)) as executor:
+                partials = list(executor.map(_evaluate_shard, shards))
+        finally:
+            shared.close()
+
+    blocks = [block for per_user, _ in partials for block in per_user]
+    counts = {k: sum(shard_counts[k] for _, shard_counts in partials) for k in partials[0][1]} if partials else {}
+    return merge_blocks(blocks, counts, options["catalog_metrics"], users)
+
+
+def stream_evaluate(model, test, k=10, metrics=("precision", "recall", "ndcg"), k_list=None,
+                    block_size=1024, remove_seen=True, auc=False):
+    """Evaluate any recommender by streaming score blocks, without building the full prediction table.
+    Scores are pulled from `model.score_blocks`; for each block, seen items are masked, top-k and the
+    metric contributions are computed, and the scores are discarded. Peak memory is O(block_size * n_items).
+
+    Args:
+        model (WRMF.base_recommender.Recommender): trained model with its train_set.
+        test (DataFrame or scipy.sparse.csr_matrix): test data, or its relevance matrix in the model index space.
+        k (int): cutoff, used when k_list is None.
+        metrics (list or tuple): metric names, keys of METRIC_KERNELS or CATALOG_METRICS.
+        k_list (list or tuple): cutoffs. If None, (k,).
+        block_size (int): number of users scored at a time.
+        remove_seen (bool): flag to remove items seen in the training data from the recommendations.
+        auc (bool): if True, also compute the full-catalog AUC of every user (ranks the whole block).
+
+    Returns:
+        EvaluationResult: means, per_user and users (model user indices of the per-user arrays).
+    """
+    k_list = sorted((k,) if k_list is None else k_list)
+    relevance = test_relevance(model, test)
+    users = np.flatnonzero(np.diff(relevance.indptr) > 0)
+    seen = sp.csr_matrix(model.train_set.csr_matrix) if remove_seen else None
+
+    evaluator = RankingEvaluator(metrics=metrics, k_list=k_list)
+    catalog_metrics = [m for m in metrics if m in CATALOG_METRICS]
+    counts = catalog_counts(catalog_metrics, k_list, relevance.shape[1])
+
+    blocks = []
+    for block_users, scores in model.score_blocks(users, block_size):
+        blocks.append(evaluate_block(scores, block_users, relevance, seen, evaluator, counts, auc))
+        del scores
+
+    return merge_blocks(blocks, counts, catalog_metrics, users)
@@ -97,10 +97,22 @@ def ndcg_at_k(top_k_recommend, user_item_ids, k=None):
 
 
 def ranking_metrics(top_k_recommend, user_item_ids, k=None):
+    from Evaluation.fast_ranking_metrics import to_sparse_inputs, RankingEvaluator
+
+    top_k = top_k_recommend.shape[1]
+    if k is None:
+        k = top_k
+    elif top_k < k:
+        print(TOP_K_ERROR)
+        return {"Precision@k": None, "Recall@k": None, "NDCG@k": None}
+
+    # hits are computed once and shared by all three metrics
+    recommendations, relevance = to_sparse_inputs(top_k_recommend, user_item_ids)
+    means = RankingEvaluator(k_list=(k,)).evaluate(recommendations, relevance).means
     return {
-        "Precision@k": precision_at_k(top_k_recommend, user_item_ids, k),
-        "Recall@k": recall_at_k(top_k_recommend, user_item_ids, k),
-        "NDCG@k": ndcg_at_k(top_k_recommend, user_item_ids, k)
+        "Precision@k": means["Precision@{}".format(k)],
+        "Recall@k": means["Recall@{}".format(k)],
+        "NDCG@k": means["NDCG@{}".format(k)],
     }
 
 
@@ -0,0 +1,159 @@
+import numpy as np
+import scipy.sparse as sp
+from WRMF.wrmf_utils import top_k_scores
+from Evaluation.fast_ranking_metrics import (
+    RankingEvaluator, EvaluationResult, METRIC_KERNELS, sampled_auc
+)
+
+SAMPLING_STRATEGY = ("uniform", "popularity")
+ERROR_SAMPLING_STRATEGY = "Invalid sampling strategy. Should be one of {'uniform', 'popularity'}"
+ERROR_TOO_FEW_NEGATIVES = "Could not sample negatives for users who have seen (almost) every item: {}"
+
+
+class NegativeSampler:
+    """Vectorized negative item sampler that never returns excluded (e.g. training) items.
+    Excluded user-item pairs are kept as sorted `user * n_items + item` keys, so a whole batch of draws
+    is checked with one searchsorted and only the collisions are redrawn.
+    The keys and the popularity distribution are built once, sampling again for another epoch is cheap.
+
+    Args:
+        exclude (scipy.sparse.csr_matrix): (n_users, n_items) items that must not be sampled,
+            e.g. train_set.csr_matrix (+ test relevance).
+        strategy (str): "uniform" or "popularity" (proportional to the number of users of each item in
+            popularity_from).
+        seed (int): random seed. Samples depend only on seed, epoch, stream and users.
+        max_iter (int): maximum number of redraw rounds.
+        popularity_from (scipy.sparse.csr_matrix): (n_users, n_items) interactions the item popularity is counted
+            on, e.g. train_set.csr_matrix, so that test interactions excluded from sampling do not leak into
+            the distribution. If None, exclude.
+    """
+
+    def __init__(self, exclude, strategy="uniform", seed=None, max_iter=100, popularity_from=None):
+        if strategy not in SAMPLING_STRATEGY:
+            raise ValueError(ERROR_SAMPLING_STRATEGY)
+
+        exclude = sp.csr_matrix(exclude)
+        exclude.sum_duplicates()
+        self.n_users, self.n_items = exclude.shape
+        rows = np.repeat(np.arange(self.n_users, dtype=np.int64), np.diff(exclude.indptr))
+        self.keys = rows * self.n_items + exclude.indices
+        self.n_excluded = np.diff(exclude.indptr)
+
+        self.cdf = None
+        if strategy == "popularity":
+            popularity_from = exclude if popularity_from is None else sp.csr_matrix(popularity_from)
+            popularity = np.bincount(popularity_from.indices, minlength=self.n_items) + 1.0
+            self.cdf = np.cumsum(popularity / popularity.sum())
+
+        self.strategy = strategy
+        self.seed = seed
+        self.max_iter = max_iter
+
+    def _draw(self, rng, size):
+        if self.cdf is None:
+            return rng.integers(0, self.n_items, size=size)
+        return np.minimum(np.searchsorted(self.cdf, rng.random(size)), self.n_items - 1)
+
+    def _is_excluded(self, users, items):
+        if len(self.keys) == 0:
+            return np.zeros(items.shape, dtype=bool)
+        queries = users * self.n_items + items
+        pos = np.minimum(np.searchsorted(self.keys, queries), len(self.keys) - 1)
+        return self.keys[pos] == queries
+
+    def sample(self, users, n_negatives, epoch=0, stream=0):
+        """Sample negative items (with replacement) for every user.
+
+        Args:
+            users (np.array): user indices.
+            n_negatives (int): negatives per user.
+            epoch (int): epoch number, combined with the seed to get a new reproducible draw.
+            stream (int): independent stream id, e.g. the block number when sampling users block by block.
+
+        Returns:
+            np.array: (len(users), n_negatives) int64 item indices.
+        """
+        users = np.asarray(users, dtype=np.int64)
+        full = users[self.n_excluded[users] >= self.n_items]
+        if len(full) > 0:
+            raise ValueError(ERROR_TOO_FEW_NEGATIVES.format(full[:10]))
+
+        rng = np.random.default_rng(None if self.seed is None else [self.seed, epoch, stream])
+        user_matrix = np.broadcast_to(users[:, None], (len(users), n_negatives))
+        items = self._draw(rng, user_matrix.shape)
+
+        redraw = self._is_excluded(user_matrix, items)
+        for _ in range(self.max_iter):
+            if not redraw.any():
+                return items
+            items[redraw] = self._draw(rng, redraw.sum())
+            redraw[redraw] = self._is_excluded(user_matrix[redraw], items[redraw])
+
+        raise ValueError(ERROR_TOO_FEW_NEGATIVES.format(np.unique(user_matrix[redraw])[:10]))
+
+
+def sampled_evaluate(model, relevance, n_negatives=100, k_list=(10,), strategy="uniform", seed=None,
+                     epoch=0, block_size=1024, sampler=None):
+    """Sampled-negative evaluation protocol.
+    Every test user ranks its relevant items together with `n_negatives` sampled unseen items.
+    Only these candidates are scored (gathered dot products, `model.score_pairs`), then HitRate@k, NDCG@k
+    and AUC are computed on the candidate list.
+
+    Args:
+        model (WRMF.wrmf.WRMF): trained model.
+        relevance (scipy.sparse.csr_matrix): (n_users, n_items) test relevance in the model index space,
+            e.g. relevance_from_df(test, model.train_set.uid_map, model.train_set.iid_map).
+        n_negatives (int): sampled negatives per user.
+        k_list (list or tuple): cutoffs.
+        strategy (str): "uniform" or "popularity" negative sampling.
+        seed (int): random seed.
+        epoch (int): epoch number, gives a new reproducible negative sample with the same sampler.
+        block_size (int): number of users scored at a time.
+        sampler (NegativeSampler): sampler to reuse across calls. If None, one is built that excludes
+            training and test items, with the popularity of training items only.
+
+    Returns:
+        EvaluationResult: means, per_user (HitRate@k, NDCG@k, AUC) and users. Without any test user,
+            per-user arrays are empty and means NaN.
+    """
+    relevance = sp.csr_matrix(relevance)
+    relevance.sum_duplicates()
+    if sampler is None:
+        sampler = NegativeSampler(
+            model.train_set.csr_matrix + relevance, strategy, seed, popularity_from=model.train_set.csr_matrix
+        )
+
+    evaluator = RankingEvaluator(metrics=("hit_rate", "ndcg"), k_list=k_list)
+    users = np.flatnonzero(np.diff(relevance.indptr) > 0)
+
+    results = []
+    for start in range(0, len(users), block_size):
+        block_users = users[start:start + block_size]
+        block_relevance = relevance[block_users]
+        n_pos = np.diff(block_relevance.indptr)
+
+        # relevant items, left-aligned and padded to the longest list of the block
+        positives = np.zeros((len(block_users), n_pos.max()), dtype=np.int64)
+        pos_mask = np.arange(positives.shape[1]) < n_pos[:, None]
+        positives[pos_mask] = block_relevance.indices
+
+        negatives = sampler.sample(block_users, n_negatives, epoch, stream=start)
+        scores = model.score_pairs(block_users, np.concatenate([positives, negatives], axis=1))
+        scores[:, :positives.shape[1]][~pos_mask] = -np.inf
+
+        candidates, _ = top_k_scores(scores, max(k_list))
+        is_positive = np.concatenate([pos_mask, np.zeros(negatives.shape, dtype=bool)], axis=1)
+        hits = np.take_along_axis(is_positive, candidates, axis=1).astype(np.float64)
+
+        result = evaluator.evaluate_hits(hits, n_pos)
+        result.per_user["AUC"] = sampled_auc(scores[:, :positives.shape[1]], scores[:, positives.shape[1]:], pos_mask)
+        results.append(result.per_user)
+
+    if not results:
+        names = [METRIC_KERNELS[metric][0].format(k) for metric in evaluator.metrics for k in evaluator.k_list]
+        return EvaluationResult({name: np.nan for name in names + ["AUC"]},
+                                {name: np.empty(0) for name in names + ["AUC"]}, users)
+
+    per_user = {name: np.concatenate([r[name] for r in results]) for name in results[0]}
+    means = {name: values.mean() for name, values in per_user.items()}
+    return EvaluationResult(means, per_user, users)
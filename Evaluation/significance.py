@@ -0,0 +1,99 @@
+import numpy as np
+
+
+def _resampled_means(values, n_resamples, rng, max_elements):
+    """Bootstrap means of values, (n_resamples, ).
+    Users are resampled with a (chunk, n_users) index matrix, chunked to hold at most max_elements indices.
+    """
+    n_users = len(values)
+    chunk = max(1, min(n_resamples, max_elements // max(n_users, 1)))
+    means = np.empty(n_resamples)
+    for start in range(0, n_resamples, chunk):
+        end = min(start + chunk, n_resamples)
+        index = rng.integers(0, n_users, size=(end - start, n_users))
+        means[start:end] = np.take(values, index).mean(axis=1)
+    return means
+
+
+def bootstrap_ci(values, n_resamples=1000, confidence=0.95, seed=None, max_elements=1 << 24):
+    """Percentile bootstrap confidence interval of the mean of a per-user metric.
+
+    Args:
+        values (np.array): (n_users, ) per-user metric values, e.g. EvaluationResult.per_user["NDCG@10"].
+        n_resamples (int): number of bootstrap resamples.
+        confidence (float): confidence level of the interval.
+        seed (int): random seed.
+        max_elements (int): maximum size of the resampling index matrix held in memory.
+
+    Returns:
+        dict: mean, low and high
+    """
+    values = np.asarray(values, dtype=np.float64)
+    values = values[~np.isnan(values)]
+    rng = np.random.default_rng(seed)
+    means = _resampled_means(values, n_resamples, rng, max_elements)
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(means, [alpha, 1 - alpha])
+    return {"mean": values.mean(), "low": low, "high": high}
+
+
+def paired_bootstrap_test(values_a, values_b, n_resamples=10000, confidence=0.95, seed=None,
+                          max_elements=1 << 24):
+    """Paired bootstrap test for the difference of the mean of a per-user metric between two models.
+    Both models are resampled with the same user indices (i.e. the per-user differences are resampled),
+    so no model is re-scored.
+
+    Args:
+        values_a (np.array): (n_users, ) per-user metric values of model A.
+        values_b (np.array): (n_users, ) per-user metric values of model B, for the same users in the same order.
+        n_resamples (int): number of bootstrap resamples.
+        confidence (float): confidence level of the intervals.
+        seed (int): random seed.
+        max_elements (int): maximum size of the resampling index matrix held in memory.
+
+    Returns:
+        dict: mean_a, mean_b, diff (mean_b - mean_a), diff_low, diff_high and the two-sided p_value of diff = 0.
+    """
+    values = np.column_stack([values_a, values_b]).astype(np.float64)
+    values = values[~np.isnan(values).any(axis=1)]
+    rng = np.random.default_rng(seed)
+    diffs = _resampled_means(values[:, 1] - values[:, 0], n_resamples, rng, max_elements)
+
+    alpha = (1 - confidence) / 2
+    low, high = np.quantile(diffs, [alpha, 1 - alpha])
+    p_value = min(1.0, 2 * min(np.mean(diffs <= 0), np.mean(diffs >= 0)))
+    return {
+        "mean_a": values[:, 0].mean(),
+        "mean_b": values[:, 1].mean(),
+        "diff": values[:, 1].mean() - values[:, 0].mean(),
+        "diff_low": low,
+        "diff_high": high,
+        "p_value": p_value,
+    }
+
+
+def compare_results(result_a, result_b, metrics=None, n_resamples=10000, confidence=0.95, seed=None):
+    """Paired bootstrap test of every metric of two evaluation results, on the users both evaluated.
+
+    Args:
+        result_a (EvaluationResult): evaluation of model A.
+        result_b (EvaluationResult): evaluation of model B.
+        metrics (list): metric names, keys of per_user. If None, all metrics of both results.
+        n_resamples (int): number of bootstrap resamples.
+        confidence (float): confidence level of the intervals.
+        seed (int): random seed.
+
+    Returns:
+        dict: paired_bootstrap_test result by metric name
+    """
+    _, index_a, index_b = np.intersect1d(result_a.users, result_b.users, return_indices=True)
+    if metrics is None:
+        metrics = [name for name in result_a.per_user if name in result_b.per_user]
+
+    return {
+        name: paired_bootstrap_test(
+            result_a.per_user[name][index_a], result_b.per_user[name][index_b],
+            n_resamples, confidence, seed,
+        )
+        for name in metrics
+    }
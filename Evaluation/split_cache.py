@@ -0,0 +1,182 @@
+import os
+import json
+import numbers
+import shutil
+import hashlib
+import logging
+import numpy as np
+import pandas as pd
+from Evaluation.data_split import split_data, partition_split
+from utils.common.constants import (
+    DEFAULT_SPLIT_FLAG,
+    DEFAULT_TEST_SIZE,
+    DEFAULT_VAL_SIZE
+)
+
+log = logging.getLogger(__name__)
+
+DEFAULT_CACHE_DIR = os.path.join(os.path.expanduser("~"), ".cache", "wrmf", "splits")
+DEFAULT_CACHE_BYTES = 1 << 30
+CACHE_FORMAT = 1
+# uint8 codes of the split flags, DROPPED marks val/test rows removed by intersect
+FLAG_CODES = {"train": 0, "val": 1, "test": 2}
+FLAG_NAMES = np.array(["train", "val", "test"], dtype=object)
+DROPPED = 255
+ROW_COL = "__split_cache_row"
+
+
+def data_fingerprint(data):
+    """Fingerprint of a DataFrame: shape, column names and dtypes, and a hash of every row.
+    Rows are hashed with pd.util.hash_pandas_object (vectorized, index included).
+
+    Args:
+        data (DataFrame): data to fingerprint.
+
+    Returns:
+        str: sha256 hex digest
+    """
+    digest = hashlib.sha256()
+    digest.update(repr((data.shape, [(str(c), str(t)) for c, t in data.dtypes.items()])).encode())
+    digest.update(pd.util.hash_pandas_object(data, index=True).to_numpy().tobytes())
+    return digest.hexdigest()
+
+
+def split_key(fingerprint, **params):
+    """Cache key of a split: data fingerprint and split parameters."""
+    params = json.dumps(dict(params, format=CACHE_FORMAT, fingerprint=fingerprint), sort_keys=True)
+    return hashlib.sha256(params.encode()).hexdigest()
+
+
+def _entry_size(entry_dir):
+    return sum(entry.stat().st_size for entry in os.scandir(entry_dir) if entry.is_file())
+
+
+def evict(cache_dir, max_bytes=DEFAULT_CACHE_BYTES):
+    """Remove the least recently used entries until the cache holds at most max_bytes.
+
+    Args:
+        cache_dir (str): cache directory.
+        max_bytes (int): size bound of the cache.
+
+    Returns:
+        int: number of removed entries
+    """
+    if not os.path.isdir(cache_dir):
+        return 0
+    entries = [e for e in os.scandir(cache_dir) if e.is_dir() and not e.name.endswith(".tmp")]
+    entries = sorted(entries, key=lambda e: e.stat().st_mtime)
+    sizes = [_entry_size(e.path) for e in entries]
+
+    total, removed = sum(sizes), 0
+    for entry, size in zip(entries, sizes):
+        if total <= max_bytes:
+            break
+        shutil.rmtree(entry.path, ignore_errors=True)
+        total -= size
+        removed += 1
+        log.info("Split cache evicted {} ({} bytes)".format(entry.name, size))
+    return removed
+
+
+def _store(entry_dir, rows, flags):
+    tmp_dir = "{}.{}.tmp".format(entry_dir, os.getpid())
+    os.makedirs(tmp_dir, exist_ok=True)
+    np.save(os.path.join(tmp_dir, "rows.npy"), rows)
+    np.save(os.path.join(tmp_dir, "flags.npy"), flags)
+    try:
+        os.replace(tmp_dir, entry_dir)
+    except OSError:
+        # stored concurrently by another process
+        shutil.rmtree(tmp_dir, ignore_errors=True)
+
+
+def _compute(data, split_strategy, test_size, val_size, validation, random_state, intersect):
+    """Run split_data and encode the result as (rows, flags): row positions in data, in the order of the
+    split labeled DataFrame, and uint8 flag codes.
+    """
+    df_split = split_data(
+        data.assign(**{ROW_COL: np.arange(len(data))}), split_strategy, test_size, val_size,
+        validation, random_state, intersect=False
+    )
+    if df_split is None:
+        return None
+
+    rows = df_split[ROW_COL].to_numpy(dtype=np.int64)
+    flags = df_split[DEFAULT_SPLIT_FLAG].map(FLAG_CODES).to_numpy(dtype=np.uint8)
+    if intersect:
+        kept = np.concatenate([frame[ROW_COL].to_numpy() for frame in partition_split(df_split, validation)])
+        is_kept = np.zeros(len(data), dtype=bool)
+        is_kept[kept] = True
+        flags[~is_kept[rows]] = DROPPED
+    return rows, flags
+
+
+def _decode(data, rows, flags, validation, intersect):
+    """Rebuild the split_data output from the cached rows and flags."""
+    df_split = data.iloc[rows].reset_index(drop=True)
+    flags = np.asarray(flags)
+    if not intersect:
+        df_split[DEFAULT_SPLIT_FLAG] = FLAG_NAMES[flags]
+        return df_split
+
+    splits = ("train", "val", "test") if validation else ("train", "test")
+    return tuple(df_split[flags == FLAG_CODES[flag]] for flag in splits)
+
+
+def cached_split_data(data, split_strategy='leave_one_last',
+                      test_size=DEFAULT_TEST_SIZE, val_size=DEFAULT_VAL_SIZE,
+                      validation=False, random_state=None, intersect=True,
+                      cache_dir=DEFAULT_CACHE_DIR, max_bytes=DEFAULT_CACHE_BYTES):
+    """split_data with an on-disk cache keyed by the data fingerprint and the split parameters.
+    An entry holds the row order (int64) and the split flags (uint8) of the split labeled DataFrame, and is
+    memory-mapped on a hit, so only the output frames are built. Entries are evicted least recently used first
+    to keep the cache under max_bytes. random_by_user splits without random_state, and splits with a random
+    generator rather than an integer seed as random_state, are not cached.
+
+    Args:
+        data (DataFrame): data to split
+        split_strategy (str): Data split strategy
+                                - "leave_one_last", "temporal_user", "temporal_global", "random_by_user"
+        test_size (float): the proportion of the dataset to include in the test split
+        val_size (float): the proportion of the dataset to include in the val split
+        validation (bool): Default False. If True, split train/val/test. If False, split train/test
+        random_state (int or np.random.Generator): random state, only integer seeds are cached.
+        intersect (bool): if True, return split data which is removed user and item ids not in train.
+        cache_dir (str): cache directory.
+        max_bytes (int): size bound of the cache.
+
+    Returns:
+        DataFrame : same as split_data.
+    """
+    if split_strategy == "random_by_user" and random_state is None:
+        log.info("Split cache skipped: random_by_user split without random_state")
+        return split_data(data, split_strategy, test_size, val_size, validation, random_state, intersect)
+    if random_state is not None and not isinstance(random_state, numbers.Integral):
+        # a generator has no stable key, its state changes with every draw
+        log.info("Split cache skipped: random_state is not an integer seed")
+        return split_data(data, split_strategy, test_size, val_size, validation, random_state, intersect)
+    if random_state is not None:
+        random_state = int(random_state)
+
+    key = split_key(
+        data_fingerprint(data), split_strategy=split_strategy, test_size=test_size, val_size=val_size,
+        validation=validation, random_state=random_state, intersect=intersect
+    )
+    entry_dir = os.path.join(cache_dir, key)
+
+    if os.path.isdir(entry_dir):
+        log.info("Split cache hit {}".format(key))
+        os.utime(entry_dir)
+        rows = np.load(os.path.join(entry_dir, "rows.npy"), mmap_mode="r")
+        flags = np.load(os.path.join(entry_dir, "flags.npy"), mmap_mode="r")
+        return _decode(data, rows, flags, validation, intersect)
+
+    log.info("Split cache miss {}".format(key))
+    encoded = _compute(data, split_strategy, test_size, val_size, validation, random_state, intersect)
+    if encoded is None:
+        return None
+
+    os.makedirs(cache_dir, exist_ok=True)
+    _store(entry_dir, *encoded)
+    evict(cache_dir, max_bytes)
+    return _decode(data, *encoded, validation, intersect)
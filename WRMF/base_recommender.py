@@ -15,11 +15,57 @@
 
 import os
 import copy
+import json
+import hashlib
 import inspect
 import pickle
 from glob import glob
 from datetime import datetime
 from WRMF.wrmf_utils import *
+from WRMF.sparse_dataset import SparseDataset
+
+MANIFEST_FILE = "manifest.json"
+LEAN_FORMAT = "lean-v1"
+ERROR_CLONE = "Cannot clone {}: {} not kept by the model (e.g. saved with lean=True), pass them in new_params"
+
+
+class _HashingWriter:
+    """File wrapper computing the sha256 of everything written through it"""
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+
+    def write(self, data):
+        self.sha256.update(data)
+        return self.file.write(data)
+
+
+def _file_sha256(path, block_size=1 << 20):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(block_size), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def _read_manifest(model_dir):
+    manifest_path = os.path.join(model_dir, MANIFEST_FILE)
+    if not os.path.exists(manifest_path):
+        return None
+    with open(manifest_path, "r") as f:
+        return json.load(f)
+
+
+def _update_manifest(model_dir, file_name, content_hash):
+    manifest = _read_manifest(model_dir) or {"latest": None, "versions": {}}
+    manifest["latest"] = content_hash
+    manifest["versions"][content_hash] = file_name
+
+    tmp_path = os.path.join(model_dir, MANIFEST_FILE + ".tmp")
+    with open(tmp_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    os.replace(tmp_path, os.path.join(model_dir, MANIFEST_FILE))
 
 
 class Recommender:
@@ -44,9 +90,11 @@ class Recommender:
         self.val_set = None
         # attributes to be ignored when being saved
         self.ignored_attrs = ["train_set", "val_set"]
+        # attributes only needed for training, also ignored by lean saving
+        self.training_attrs = []
 
     def reset_info(self):
-        self.best_value = -np.Inf
+        self.best_value = -np.inf
         self.best_epoch = 0
         self.current_epoch = 0
         self.stopped_epoch = 0
@@ -86,13 +134,17 @@ class Recommender:
         object: :obj:`cornac.models.Recommender`
         """
         new_params = {} if new_params is None else new_params
+        missing = [name for name in self._get_init_params() if name not in new_params and not hasattr(self, name)]
+        if missing:
+            raise ValueError(ERROR_CLONE.format(self.name, missing))
+
         init_params = {}
         for name in self._get_init_params():
-            init_params[name] = new_params.get(name, copy.deepcopy(getattr(self, name)))
+            init_params[name] = new_params[name] if name in new_params else copy.deepcopy(getattr(self, name))
 
         return self.__class__(**init_params)
 
-    def save(self, save_dir=None):
+    def save(self, save_dir=None, lean=False):
         """Save a recommender model to the filesystem.
 
         Parameters
@@ -100,6 +152,12 @@ class Recommender:
         save_dir: str, default: None
             Path to a directory for the model to be stored.
 
+        lean: boolean, optional, default: False
+            When True, only the state needed for inference is pickled straight to disk,
+            without deep-copying the model. Attributes listed in `training_attrs`
+            (e.g., raw training data) are skipped as well, and the train set is replaced
+            by its id maps and counts (see `SparseDataset.lean_copy`).
+
         Returns
         -------
         model_file : str
@@ -113,41 +171,89 @@ class Recommender:
         timestamp = datetime.now().strftime("%Y-%m-%d_%H-%M-%S-%f")
         model_file = os.path.join(model_dir, "{}.pkl".format(timestamp))
 
-        saved_model = copy.deepcopy(self)
+        if lean:
+            skipped_attrs = set(self.ignored_attrs) | set(getattr(self, "training_attrs", []))
+            state = {k: v for k, v in self.__dict__.items() if k not in skipped_attrs}
+            if self.train_set is not None:
+                state["train_set"] = SparseDataset.lean_copy(self.train_set)
+            saved_model = (LEAN_FORMAT, self.__class__, state)
+        else:
+            saved_model = copy.deepcopy(self)
+
+        tmp_file = model_file + ".tmp"
+        with open(tmp_file, "wb") as f:
+            writer = _HashingWriter(f)
+            pickle.dump(saved_model, writer, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_file, model_file)
 
-        pickle.dump(
-            saved_model, open(model_file, "wb"), protocol=pickle.HIGHEST_PROTOCOL
-        )
+        content_hash = writer.sha256.hexdigest()
+        _update_manifest(model_dir, os.path.basename(model_file), content_hash)
 
         if self.verbose:
-            print("{} model is saved to {}".format(self.name, model_file))
+            print("{} model is saved to {} (sha256={})".format(self.name, model_file, content_hash))
 
         return model_file
 
     @staticmethod
-    def load(model_path, trainable=False):
+    def load(model_path, trainable=False, version=None, verify=False):
         """Load a recommender model from the filesystem.
 
         Parameters
         ----------
         model_path: str, required
             Path to a file or directory where the model is stored. If a directory is
-            provided, the latest model will be loaded.
+            provided, the latest model recorded in its manifest will be loaded.
 
         trainable: boolean, optional, default: False
             Set it to True if you would like to finetune the model. By default,
             the model parameters are assumed to be fixed after being loaded.
 
+        version: str, optional, default: None
+            Content hash (or a unique prefix of it) of the model to load from a directory.
+            If None, the latest saved model is loaded.
+
+        verify: boolean, optional, default: False
+            When True, the content hash of the model file is checked against the manifest.
+
         Returns
         -------
         self : object
         """
+        content_hash = None
         if os.path.isdir(model_path):
-            model_file = sorted(glob("{}/*.pkl".format(model_path)))[-1]
+            manifest = _read_manifest(model_path)
+            if manifest is None:
+                if version is not None:
+                    raise ValueError("No manifest in {} to look up version {}".format(model_path, version))
+                model_file = sorted(glob("{}/*.pkl".format(model_path)))[-1]
+            else:
+                content_hash = manifest["latest"] if version is None else version
+                matches = [h for h in manifest["versions"] if h.startswith(content_hash)]
+                if len(matches) != 1:
+                    raise ValueError("Version {} matches {} saved models".format(content_hash, len(matches)))
+                content_hash = matches[0]
+                model_file = os.path.join(model_path, manifest["versions"][content_hash])
         else:
             model_file = model_path
 
-        model = pickle.load(open(model_file, "rb"))
+        if verify:
+            if content_hash is None:
+                manifest = _read_manifest(os.path.dirname(model_file)) or {"versions": {}}
+                hashes = [h for h, f in manifest["versions"].items() if f == os.path.basename(model_file)]
+                content_hash = hashes[0] if hashes else None
+            if content_hash is None or _file_sha256(model_file) != content_hash:
+                raise IOError("Failed to verify {}".format(model_file))
+
+        with open(model_file, "rb") as f:
+            model = pickle.load(f)
+
+        if isinstance(model, tuple) and len(model) == 3 and model[0] == LEAN_FORMAT:
+            _, cls, state = model
+            model = cls.__new__(cls)
+            model.__dict__.update(state)
+            model.train_set = state.get("train_set")
+            model.val_set = None
+
         model.trainable = trainable
         model.load_from = model_file  # for further loading
 
@@ -193,6 +299,48 @@ class Recommender:
         """
         raise NotImplementedError("The algorithm is not able to make score prediction!")
 
+    def score_batch(self, user_indices, item_indices=None):
+        """Predict the scores of a batch of users for all known items (or the given items).
+        Overwrite this function if your algorithm can score several users at once.
+
+        Parameters
+        ----------
+        user_indices: 1d array, required
+            The indices of the users for whom to perform score prediction.
+
+        item_indices: 1d array, optional, default: None
+            The indices of the items for which to perform score prediction.
+            If None, scores for all known items will be returned.
+
+        Returns
+        -------
+        res : Numpy array, shape (len(user_indices), n_items)
+            Relative scores that the users give to the items
+        """
+        scores = np.vstack([self.score(user_idx) for user_idx in user_indices])
+        return scores if item_indices is None else scores[:, item_indices]
+
+    def score_blocks(self, user_indices, block_size=1024):
+        """Generate the scores of users block by block, so only one block is held in memory at a time.
+
+        Parameters
+        ----------
+        user_indices: 1d array, required
+            The indices of the users for whom to perform score prediction.
+
+        block_size: int, optional, default: 1024
+            Number of users scored at a time.
+
+        Returns
+        -------
+        (block_users, scores) : generator of tuples
+            `block_users` are the user indices of the block and `scores` their
+            (len(block_users), n_items) score matrix.
+        """
+        for start in range(0, len(user_indices), block_size):
+            block_users = user_indices[start:start + block_size]
+            yield block_users, self.score_batch(block_users)
+
     def default_score(self):
         """Overwrite this function if your algorithm has special treatment for cold-start problem
 
@@ -0,0 +1,88 @@
+import numpy as np
+import scipy.sparse as sp
+from utils.common.timer import Timer
+
+
+class Callback:
+    """Base class of the callbacks passed to `WRMF.fit`. Overwrite the hooks you need.
+
+    Hooks receive the model being trained. While fitting, `model.get_factors()` returns the live U and V.
+    """
+
+    def on_train_begin(self, model):
+        pass
+
+    def on_batch_end(self, model, batch, logs):
+        """Called after every training batch. logs: {"epoch", "loss"}"""
+        pass
+
+    def on_epoch_end(self, model, epoch, logs):
+        """Called after every epoch. logs: {"loss"}, mean loss of the epoch"""
+        pass
+
+    def on_train_end(self, model):
+        pass
+
+
+class EvaluationCallback(Callback):
+    """Evaluate the live factors on validation/test data every `every` epochs.
+    The relevance matrix, seen-item matrix and DCG discount tables are prepared once when training begins.
+    Time spent evaluating is accumulated in `eval_time`, apart from the training time.
+
+    Args:
+        test (DataFrame or scipy.sparse.csr_matrix): validation/test data, or its relevance matrix
+            in the model index space.
+        k_list (list or tuple): cutoffs.
+        metrics (list or tuple): metric names, keys of METRIC_KERNELS or CATALOG_METRICS.
+        every (int): evaluate every `every` epochs.
+        block_size (int): number of users scored at a time.
+        remove_seen (bool): flag to remove items seen in the training data from the recommendations.
+        verbose (bool): print the metrics after each evaluation.
+    """
+
+    def __init__(self, test, k_list=(10,), metrics=("precision", "recall", "ndcg"), every=1,
+                 block_size=1024, remove_seen=True, verbose=True):
+        self.test = test
+        self.k_list = sorted(k_list)
+        self.metrics = metrics
+        self.every = every
+        self.block_size = block_size
+        self.remove_seen = remove_seen
+        self.verbose = verbose
+        self.history = []
+        self.eval_time = 0
+
+    def on_train_begin(self, model):
+        # imported here, so that the WRMF package does not depend on Evaluation at import time
+        from Evaluation.fast_ranking_metrics import RankingEvaluator, CATALOG_METRICS
+        from Evaluation.model_evaluation import test_relevance
+
+        with Timer() as t:
+            self.relevance = test_relevance(model, self.test)
+            self.users = np.flatnonzero(np.diff(self.relevance.indptr) > 0)
+            self.seen = sp.csr_matrix(model.train_set.csr_matrix) if self.remove_seen else None
+            self.evaluator = RankingEvaluator(metrics=self.metrics, k_list=self.k_list)
+            self.catalog_metrics = [m for m in self.metrics if m in CATALOG_METRICS]
+        self.eval_time += t.interval
+
+    def on_epoch_end(self, model, epoch, logs):
+        if (epoch + 1) % self.every != 0:
+            return
+        from Evaluation.model_evaluation import evaluate_block, merge_blocks, catalog_counts
+
+        with Timer() as t:
+            U, V = model.get_factors()
+            counts = catalog_counts(self.catalog_metrics, self.k_list, V.shape[0])
+            blocks = []
+            for start in range(0, len(self.users), self.block_size):
+                block_users = self.users[start:start + self.block_size]
+                scores = U[block_users].dot(V.T)
+                blocks.append(evaluate_block(scores, block_users, self.relevance, self.seen, self.evaluator, counts))
+            result = merge_blocks(blocks, counts, self.catalog_metrics, self.users)
+        self.eval_time += t.interval
+
+        self.history.append(dict(epoch=epoch + 1, loss=logs.get("loss"), **result.means))
+        if self.verbose:
+            print("epoch {}: {} ({:.4f} s)".format(
+                epoch + 1, ", ".join("{}={:.6f}".format(k, v) for k, v in result.means.items()), t.interval
+            ))
@@ -0,0 +1,243 @@
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from WRMF.wrmf_utils import get_rng, id_array
+from utils.common.constants import (
+    DEFAULT_USER_COL,
+    DEFAULT_ITEM_COL,
+    DEFAULT_RATING_COL,
+)
+
+
+class ArrayIdMap:
+    """Read-only raw id to index mapping backed by arrays, a replacement for the uid_map/iid_map dicts.
+    Raw ids are kept sorted with their indices, so lookups are a searchsorted (vectorized with get_indexer).
+    Iteration follows the index order, like the OrderedDict of a cornac Dataset.
+
+    Args:
+        ids (np.array): raw ids ordered by index, ids[index] == raw id. Ids must be unique and sortable.
+    """
+
+    __slots__ = ("ids", "sorted_ids", "sorted_idx")
+
+    def __init__(self, ids):
+        self.ids = np.asarray(ids)
+        self.sorted_idx = np.argsort(self.ids, kind="mergesort")
+        self.sorted_ids = self.ids[self.sorted_idx]
+
+    def get_indexer(self, raw_ids):
+        """Return the indices of raw ids, -1 for unknown ids."""
+        raw_ids = np.asarray(raw_ids)
+        if len(self.ids) == 0:
+            return np.full(raw_ids.shape, -1, dtype=np.int64)
+        pos = np.minimum(np.searchsorted(self.sorted_ids, raw_ids), len(self.ids) - 1)
+        return np.where(self.sorted_ids[pos] == raw_ids, self.sorted_idx[pos], -1)
+
+    def get(self, raw_id, default=None):
+        index = self.get_indexer([raw_id])[0]
+        return default if index < 0 else int(index)
+
+    def __getitem__(self, raw_id):
+        index = self.get(raw_id)
+        if index is None:
+            raise KeyError(raw_id)
+        return index
+
+    def __contains__(self, raw_id):
+        return self.get(raw_id) is not None
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __iter__(self):
+        return iter(self.ids.tolist())
+
+    def keys(self):
+        return self.ids.tolist()
+
+    def values(self):
+        return range(len(self.ids))
+
+    def items(self):
+        return zip(self.ids.tolist(), range(len(self.ids)))
+
+
+class SparseDataset:
+    """Lightweight user-item dataset backed by CSR and CSC arrays, a drop-in for the cornac Dataset
+    in `Recommender.fit`, `score` and `wrmf_rec`, without importing cornac.
+    Ratings are float32 and indices int32, each matrix is stored once.
+
+    Args:
+        csr (scipy.sparse.csr_matrix): (n_users, n_items) user-item ratings.
+        user_ids (np.array): raw user ids ordered by row index.
+        item_ids (np.array): raw item ids ordered by column index.
+        seed (int): random seed of the shuffling iterators.
+    """
+
+    __slots__ = (
+        "csr_matrix", "csc_matrix", "uid_map", "iid_map", "num_users", "num_items", "num_ratings",
+        "global_mean", "min_rating", "max_rating", "seed", "rng",
+    )
+
+    def __init__(self, csr, user_ids, item_ids, seed=None):
+        csr = sp.csr_matrix(csr, dtype=np.float32)
+        csr.sum_duplicates()
+        self.csr_matrix = csr
+        self.csc_matrix = csr.tocsc()
+        self.csc_matrix.sort_indices()
+        self.uid_map = ArrayIdMap(user_ids)
+        self.iid_map = ArrayIdMap(item_ids)
+        self.num_users, self.num_items = csr.shape
+        self.num_ratings = csr.nnz
+        self.global_mean = csr.data.mean() if csr.nnz else 0.0
+        self.min_rating = csr.data.min() if csr.nnz else 0.0
+        self.max_rating = csr.data.max() if csr.nnz else 0.0
+        self.seed = seed
+        self.rng = get_rng(seed)
+
+    @classmethod
+    def from_uir(cls, users, items, ratings, seed=None):
+        """Build a dataset from user, item and rating arrays, as cornac.data.Dataset.from_uir does.
+        Duplicated user-item pairs are removed keeping the first one, and ids are indexed in order of first
+        appearance.
+
+        Args:
+            users (np.array): raw user ids.
+            items (np.array): raw item ids.
+            ratings (np.array): ratings.
+            seed (int): random seed of the shuffling iterators.
+
+        Returns:
+            SparseDataset: dataset
+        """
+        user_idx, user_ids = pd.factorize(np.asarray(users))
+        item_idx, item_ids = pd.factorize(np.asarray(items))
+        ratings = np.asarray(ratings, dtype=np.float32)
+
+        keys = user_idx.astype(np.int64) * len(item_ids) + item_idx
+        _, first = np.unique(keys, return_index=True)
+        if len(first) < len(keys):
+            first.sort()
+            user_idx, item_idx, ratings = user_idx[first], item_idx[first], ratings[first]
+
+        csr = sp.csr_matrix((ratings, (user_idx, item_idx)), shape=(len(user_ids), len(item_ids)))
+        return cls(csr, np.asarray(user_ids), np.asarray(item_ids), seed)
+
+    @classmethod
+    def from_df(cls, data, seed=None):
+        """Build a dataset from a DataFrame with user, item and rating columns, see from_uir."""
+        return cls.from_uir(
+            data[DEFAULT_USER_COL].to_numpy(), data[DEFAULT_ITEM_COL].to_numpy(),
+            data[DEFAULT_RATING_COL].to_numpy(), seed,
+        )
+
+    @classmethod
+    def lean_copy(cls, train_set):
+        """Copy the id maps, counts and rating statistics of a train set (cornac Dataset or SparseDataset),
+        without its rating matrices (csr_matrix and csc_matrix are None). Enough to score and recommend with
+        a trained model, e.g. one saved with lean=True.
+
+        Args:
+            train_set (cornac.data.Dataset or SparseDataset): train set of a model.
+
+        Returns:
+            SparseDataset: dataset without ratings
+        """
+        dataset = cls.__new__(cls)
+        dataset.csr_matrix = None
+        dataset.csc_matrix = None
+        dataset.uid_map = ArrayIdMap(id_array(train_set.uid_map))
+        dataset.iid_map = ArrayIdMap(id_array(train_set.iid_map))
+        dataset.num_users, dataset.num_items = train_set.num_users, train_set.num_items
+        dataset.num_ratings = train_set.num_ratings
+        dataset.global_mean = train_set.global_mean
+        dataset.min_rating, dataset.max_rating = train_set.min_rating, train_set.max_rating
+        dataset.seed = train_set.seed
+        dataset.rng = get_rng(train_set.seed)
+        return dataset
+
+    @property
+    def total_users(self):
+        return self.num_users
+
+    @property
+    def total_items(self):
+        return self.num_items
+
+    @property
+    def user_ids(self):
+        return self.uid_map.keys()
+
+    @property
+    def item_ids(self):
+        return self.iid_map.keys()
+
+    def is_unk_user(self, user_idx):
+        """Return whether a user index is unknown (out of the train set)."""
+        return user_idx >= self.num_users
+
+    def is_unk_item(self, item_idx):
+        """Return whether an item index is unknown (out of the train set)."""
+        return item_idx >= self.num_items
+
+    def reset(self):
+        """Reset the random number generator for reproducibility"""
+        self.rng = get_rng(self.seed)
+        return self
+
+    def _idx_iter(self, n, batch_size, shuffle):
+        indices = np.arange(n)
+        if shuffle:
+            self.rng.shuffle(indices)
+        for start in range(0, n, batch_size):
+            yield indices[start:start + batch_size]
+
+    def user_iter(self, batch_size=1, shuffle=False):
+        """Iterate over batches of user indices."""
+        return self._idx_iter(self.num_users, batch_size, shuffle)
+
+    def item_iter(self, batch_size=1, shuffle=False):
+        """Iterate over batches of item indices."""
+        return self._idx_iter(self.num_items, batch_size, shuffle)
+
+    def user_block_iter(self, batch_size=1, shuffle=False):
+        """Iterate over contiguous blocks of users with their ratings, without copying.
+
+        Args:
+            batch_size (int): number of users of a block.
+            shuffle (bool): if True, blocks come in random order.
+
+        Returns:
+            generator: (start, end, csr_matrix of rows start:end whose data and indices are views
+                of the dataset arrays)
+        """
+        return self._block_iter(self.csr_matrix, sp.csr_matrix, batch_size, shuffle)
+
+    def item_block_iter(self, batch_size=1, shuffle=False):
+        """Iterate over contiguous blocks of items with their ratings, without copying.
+
+        Args:
+            batch_size (int): number of items of a block.
+            shuffle (bool): if True, blocks come in random order.
+
+        Returns:
+            generator: (start, end, csc_matrix of columns start:end whose data and indices are views
+                of the dataset arrays)
+        """
+        return self._block_iter(self.csc_matrix, sp.csc_matrix, batch_size, shuffle)
+
+    def _block_iter(self, matrix, fmt, batch_size, shuffle):
+        n = len(matrix.indptr) - 1
+        starts = np.arange(0, n, batch_size)
+        if shuffle:
+            self.rng.shuffle(starts)
+        for start in starts:
+            end = min(start + batch_size, n)
+            begin, stop = matrix.indptr[start], matrix.indptr[end]
+            shape = (end - start, matrix.shape[1]) if fmt is sp.csr_matrix else (matrix.shape[0], end - start)
+            # set the arrays directly, the (data, indices, indptr) constructor copies slices
+            block = fmt(shape, dtype=matrix.dtype)
+            block.data = matrix.data[begin:stop]
+            block.indices = matrix.indices[begin:stop]
+            block.indptr = matrix.indptr[start:end + 1] - begin
+            yield start, end, block
@@ -14,10 +14,14 @@
 # ============================================================================
 
 import os
+import warnings
+from collections import OrderedDict
+import pandas as pd
 from tqdm.auto import trange
 from .base_recommender import Recommender
-import cornac
+from .sparse_dataset import SparseDataset
 from WRMF.wrmf_utils import *
+from utils.common.timer import Timer
 from utils.common.constants import (
     DEFAULT_USER_COL,
     DEFAULT_ITEM_COL,
@@ -26,12 +30,53 @@ from utils.common.constants import (
 )
 
 
-def prepare_cornac_data(data):
-    return cornac.data.Dataset.from_uir(
-        data[[DEFAULT_USER_COL, DEFAULT_ITEM_COL, DEFAULT_RATING_COL]].itertuples(index=False)
+def prepare_cornac_data(data, seed=None):
+    """Build a cornac Dataset from user-item-rating data, as cornac.data.Dataset.from_uir does, from arrays.
+    Duplicated user-item pairs are removed keeping the first one, and ids are indexed in order of
+    first appearance with pd.factorize, so the id maps and rating arrays are the ones of from_uir.
+
+    Args:
+        data (pd.DataFrame): user-item-rating data.
+        seed (int): random seed of the dataset (e.g. for item_iter shuffling).
+
+    Returns:
+        cornac.data.Dataset: train set for WRMF.fit
+    """
+    import cornac
+
+    uir = data[[DEFAULT_USER_COL, DEFAULT_ITEM_COL, DEFAULT_RATING_COL]]
+    duplicated = uir.duplicated([DEFAULT_USER_COL, DEFAULT_ITEM_COL], keep="first").to_numpy()
+    if duplicated.any():
+        warnings.warn("%d duplicated observations are removed!" % duplicated.sum())
+        uir = uir[~duplicated]
+
+    user_idx, user_ids = pd.factorize(uir[DEFAULT_USER_COL])
+    item_idx, item_ids = pd.factorize(uir[DEFAULT_ITEM_COL])
+    return cornac.data.Dataset(
+        num_users=len(user_ids),
+        num_items=len(item_ids),
+        uid_map=OrderedDict(zip(user_ids.tolist(), range(len(user_ids)))),
+        iid_map=OrderedDict(zip(item_ids.tolist(), range(len(item_ids)))),
+        uir_tuple=(
+            user_idx.astype("int"), item_idx.astype("int"), uir[DEFAULT_RATING_COL].to_numpy(dtype="float")
+        ),
+        seed=seed,
     )
 
 
+def prepare_data(data, seed=None):
+    """Build a SparseDataset from user-item-rating data, the cornac-free counterpart of prepare_cornac_data.
+
+    Args:
+        data (pd.DataFrame): user-item-rating data.
+        seed (int): random seed of the dataset (e.g. for item_iter shuffling).
+
+    Returns:
+        SparseDataset: train set for WRMF.fit
+    """
+    return SparseDataset.from_df(data, seed)
+
+
 def train_cornac(model, data):
     train_data = prepare_cornac_data(data)
     model.fit(train_data)
@@ -128,18 +173,18 @@ class WRMF(Recommender):
         self.k = k
         self.lambda_u = lambda_u
         self.lambda_v = lambda_v
-        self.strategy = weight_strategy
+        self.weight_strategy = weight_strategy
         self.data = data
         self.alpha = alpha
         self.c_0 = c_0
 
-        if self.strategy == "user_oriented":
+        if self.weight_strategy == "user_oriented":
             self.weights = weight_user_oriented(self.data, self.alpha)
-        elif self.strategy == "item_oriented":
+        elif self.weight_strategy == "item_oriented":
             self.weights = weight_item_oriented(self.data, self.alpha)
-        elif self.strategy == "item_popularity":
+        elif self.weight_strategy == "item_popularity":
             self.weights = weight_item_popularity(self.data, self.alpha, self.c_0)
-        elif self.strategy == "uniform_pos" or self.strategy == "uniform_neg":
+        elif self.weight_strategy == "uniform_pos" or self.weight_strategy == "uniform_neg":
             self.weights = np.ones(shape=data[DEFAULT_ITEM_COL].nunique()) * alpha
         else:
             print('wrong strategy')
@@ -158,6 +203,14 @@ class WRMF(Recommender):
         self.U = self.init_params.get("U", None)
         self.V = self.init_params.get("V", None)
 
+        # raw ratings and weights are not needed to score once the model is trained
+        self.training_attrs = ["data", "weights", "init_params"]
+
+        # int8 copies of U and V, see quantize()
+        self.quantized = False
+        self.U_q, self.U_scale = None, None
+        self.V_q, self.V_scale = None, None
+
     def _init(self):
         rng = get_rng(self.seed)
         n_users, n_items = self.train_set.num_users, self.train_set.num_items
@@ -167,7 +220,7 @@ class WRMF(Recommender):
         if self.V is None:
             self.V = xavier_uniform((n_items, self.k), rng)
 
-    def fit(self, train_set, val_set=None):
+    def fit(self, train_set, val_set=None, callbacks=None):
         """Fit the model to observations.
 
         Parameters
@@ -178,20 +231,39 @@ class WRMF(Recommender):
         val_set: :obj:`cornac.data.Dataset`, optional, default: None
             User-Item preference data for model selection purposes (e.g., early stopping).
 
+        callbacks: list of :obj:`WRMF.callbacks.Callback`, optional, default: None
+            Callbacks called at the end of every batch and epoch, e.g. `EvaluationCallback`.
+
         Returns
         -------
         self : object
         """
+        # int8 factors of a previous fit would shadow the new U and V
+        self.dequantize()
         Recommender.fit(self, train_set, val_set)
 
         self._init()
 
         if self.trainable:
-            self._fit_cf()
+            self._fit_cf([] if callbacks is None else callbacks)
 
         return self
 
-    def _fit_cf(self, ):
+    def get_factors(self):
+        """Return the user and item factors (U, V). While fitting, they are read from the training session.
+        If the float factors were dropped by `quantize(keep_float=False)`, they are rebuilt from the int8 ones.
+
+        Returns
+        -------
+        (U, V) : tuple of Numpy arrays
+        """
+        if getattr(self, "_live_factors", None) is not None:
+            return self._live_factors()
+        if self.U is None and getattr(self, "quantized", False):
+            return dequantize_int8(self.U_q, self.U_scale), dequantize_int8(self.V_q, self.V_scale)
+        return self.U, self.V
+
+    def _fit_cf(self, callbacks=()):
         import tensorflow as tf
         from .wrmf_model import Model
 
@@ -220,54 +292,91 @@ class WRMF(Recommender):
         # Training model
         config = tf.ConfigProto()
         config.gpu_options.allow_growth = True
-        with tf.Session(config=config, graph=graph) as sess:
+        callback_timer = Timer()
+        callback_time = 0
+        with Timer() as fit_timer, tf.Session(config=config, graph=graph) as sess:
             sess.run(tf.global_variables_initializer())
-
-            loop = trange(self.max_iter, disable=not self.verbose)
-            for _ in loop:
-
-                sum_loss = 0
-                count = 0
-                for i, batch_ids in enumerate(
-                        self.train_set.item_iter(self.batch_size, shuffle=True)
-                ):
-                    batch_R = R[:, batch_ids]
-
-                    if self.strategy == "uniform_pos":
-                        batch_C = np.ones(batch_R.shape)
-                        batch_C[batch_R.nonzero()] = self.alpha
-                    elif self.strategy == "uniform_neg":
-                        batch_C = np.zeros(batch_R.shape) + self.alpha
-                        batch_C[batch_R.nonzero()] = 1
-                    else:
-                        if self.strategy == "user_oriented":
-                            weight_vec = self.weights.reshape(batch_R.shape[0], -1)
+            self._live_factors = lambda: sess.run([model.U, model.V])
+            try:
+                callback_timer.start()
+                for callback in callbacks:
+                    callback.on_train_begin(self)
+                callback_timer.stop()
+                callback_time += callback_timer.interval
+
+                loop = trange(self.max_iter, disable=not self.verbose)
+                for epoch in loop:
+
+                    sum_loss = 0
+                    count = 0
+                    for i, batch_ids in enumerate(
+                            self.train_set.item_iter(self.batch_size, shuffle=True)
+                    ):
+                        batch_R = R[:, batch_ids]
+
+                        if self.weight_strategy == "uniform_pos":
+                            batch_C = np.ones(batch_R.shape)
+                            batch_C[batch_R.nonzero()] = self.alpha
+                        elif self.weight_strategy == "uniform_neg":
+                            batch_C = np.zeros(batch_R.shape) + self.alpha
+                            batch_C[batch_R.nonzero()] = 1
                         else:
-                            weight_vec = self.weights[batch_ids].reshape(-1, len(batch_ids))
-
-                        batch_C = np.zeros(batch_R.shape) + weight_vec
-                        batch_C[batch_R.nonzero()] = 1
-
-                    feed_dict = {
-                        model.ratings: batch_R.A,
-                        model.C: batch_C,
-                        model.item_ids: batch_ids,
-                    }
-                    _, _loss = sess.run(
-                        [model.opt, model.loss], feed_dict
-                    )  # train U, V
-
-                    sum_loss += _loss
-                    count += len(batch_ids)
-                    if i % 10 == 0:
-                        loop.set_postfix(loss=(sum_loss / count))
+                            if self.weight_strategy == "user_oriented":
+                                weight_vec = self.weights.reshape(batch_R.shape[0], -1)
+                            else:
+                                weight_vec = self.weights[batch_ids].reshape(-1, len(batch_ids))
+
+                            batch_C = np.zeros(batch_R.shape) + weight_vec
+                            batch_C[batch_R.nonzero()] = 1
+
+                        feed_dict = {
+                            model.ratings: batch_R.toarray(),
+                            model.C: batch_C,
+                            model.item_ids: batch_ids,
+                        }
+                        _, _loss = sess.run(
+                            [model.opt, model.loss], feed_dict
+                        )  # train U, V
+
+                        sum_loss += _loss
+                        count += len(batch_ids)
+                        if i % 10 == 0:
+                            loop.set_postfix(loss=(sum_loss / count))
+
+                        if callbacks:
+                            callback_timer.start()
+                            for callback in callbacks:
+                                callback.on_batch_end(self, i, {"epoch": epoch, "loss": _loss})
+                            callback_timer.stop()
+                            callback_time += callback_timer.interval
+
+                    callback_timer.start()
+                    for callback in callbacks:
+                        callback.on_epoch_end(self, epoch, {"loss": sum_loss / count})
+                    callback_timer.stop()
+                    callback_time += callback_timer.interval
+            finally:
+                # the session is closed past this block, get_factors() must not read from it
+                self._live_factors = None
 
             self.U, self.V = sess.run([model.U, model.V])
 
+            callback_timer.start()
+            for callback in callbacks:
+                callback.on_train_end(self)
+            callback_timer.stop()
+            callback_time += callback_timer.interval
+
         tf.reset_default_graph()
 
+        # callbacks (e.g. evaluation) are timed apart from training
+        self.train_time = fit_timer.interval - callback_time
+        self.callback_time = callback_time
+
         if self.verbose:
-            print("Learning completed!")
+            print("Learning completed! train time: {:.4f} s, callback time: {:.4f} s".format(
+                self.train_time, self.callback_time
+            ))
 
     def score(self, user_idx, item_idx=None):
         """Predict the scores/ratings of a user for an item.
@@ -292,6 +401,10 @@ class WRMF(Recommender):
                     "Can't make score prediction for (user_id=%d)" % user_idx
                 )
 
+            if getattr(self, "quantized", False):
+                return int8_scores(
+                    self.U_q[[user_idx]], self.U_scale[[user_idx]], self.V_q, self.V_scale
+                )[0]
             known_item_scores = self.V.dot(self.U[user_idx, :])
             return known_item_scores
         else:
@@ -302,8 +415,151 @@ class WRMF(Recommender):
                     "Can't make score prediction for (user_id=%d, item_id=%d)"
                     % (user_idx, item_idx)
                 )
+            if getattr(self, "quantized", False):
+                return int8_scores(
+                    self.U_q[[user_idx]], self.U_scale[[user_idx]],
+                    self.V_q[[item_idx]], self.V_scale[[item_idx]]
+                )[0, 0]
             user_pred = self.V[item_idx, :].dot(self.U[user_idx, :])
             return user_pred
 
+    def score_batch(self, user_indices, item_indices=None):
+        """Predict the scores of a batch of users for all known items (or the given items).
+
+        Parameters
+        ----------
+        user_indices: 1d array, required
+            The indices of the users for whom to perform score prediction.
+
+        item_indices: 1d array, optional, default: None
+            The indices of the items for which to perform score prediction.
+            If None, scores for all known items will be returned.
+
+        Returns
+        -------
+        res : Numpy array, shape (len(user_indices), n_items)
+            Relative scores that the users give to the items
+        """
+        user_indices = np.asarray(user_indices)
+        n_users = self.U_q.shape[0] if getattr(self, "quantized", False) else self.U.shape[0]
+        unk_users = user_indices[user_indices >= n_users]
+        if len(unk_users) > 0:
+            raise ScoreException(
+                "Can't make score prediction for (user_id=%d)" % unk_users[0]
+            )
 
+        if getattr(self, "quantized", False):
+            V_q, V_scale = self.V_q, self.V_scale
+            if item_indices is not None:
+                V_q, V_scale = V_q[item_indices], V_scale[item_indices]
+            return int8_scores(self.U_q[user_indices], self.U_scale[user_indices], V_q, V_scale)
 
+        V = self.V if item_indices is None else self.V[item_indices]
+        return self.U[user_indices].dot(V.T)
+
+    def score_pairs(self, user_indices, item_indices):
+        """Predict the scores of every user for its own list of items (gathered dot products).
+
+        Parameters
+        ----------
+        user_indices: 1d array, required
+            The indices of the users for whom to perform score prediction.
+
+        item_indices: 2d array, shape (len(user_indices), n_candidates), required
+            The candidate item indices of each user.
+
+        Returns
+        -------
+        res : Numpy array, shape (len(user_indices), n_candidates)
+            Relative scores that the users give to their candidate items
+        """
+        if getattr(self, "quantized", False):
+            scores = np.einsum(
+                "uk,umk->um",
+                self.U_q[user_indices].astype(np.float32),
+                self.V_q[item_indices].astype(np.float32),
+            )
+            return scores * self.U_scale[user_indices, None] * self.V_scale[item_indices]
+
+        return np.einsum("uk,umk->um", self.U[user_indices], self.V[item_indices])
+
+    def quantize(self, keep_float=True):
+        """Quantize U and V to int8 with one scale per row, to hold the factors in 4x less memory than float32.
+        Once quantized, `score`, `score_batch` and `score_pairs` read the int8 factors and accumulate the
+        products exactly. This is a memory saving, not a speed-up: NumPy has no int8 GEMM, so item blocks are
+        widened to float while scoring (see Benchmark/bench_quantization.py for the trade-off on a given CPU).
+
+        Parameters
+        ----------
+        keep_float: boolean, optional, default: True
+            When False, the float U and V are dropped, so only the int8 factors are held in memory and saved.
+            `get_factors` and `dequantize` then rebuild approximate float factors from them.
+
+        Returns
+        -------
+        self : object
+        """
+        U, V = self.get_factors()
+        self.U_q, self.U_scale = quantize_int8(U)
+        self.V_q, self.V_scale = quantize_int8(V)
+        self.quantized = True
+        if not keep_float:
+            self.U, self.V = None, None
+        return self
+
+    def dequantize(self):
+        """Drop the int8 factors and score with the float U and V again.
+        Float factors dropped by `quantize(keep_float=False)` are rebuilt from the int8 ones.
+
+        Returns
+        -------
+        self : object
+        """
+        if getattr(self, "quantized", False) and self.U is None:
+            self.U, self.V = self.get_factors()
+        self.U_q, self.U_scale = None, None
+        self.V_q, self.V_scale = None, None
+        self.quantized = False
+        return self
+
+    def quantization_report(self, user_indices=None, top_k=10, block_size=1024):
+        """Compare int8 scoring against the float factors. The factors are quantized for the report only,
+        the scoring path of the model (`quantized`) is left unchanged.
+
+        Parameters
+        ----------
+        user_indices: 1d array, optional, default: None
+            The users to compare on. If None, all users are used.
+
+        top_k: int, optional, default: 10
+            Size of the recommendation lists to compare.
+
+        block_size: int, optional, default: 1024
+            Number of users scored at a time.
+
+        Returns
+        -------
+        res : dict
+            Mean and minimum top-k overlap with the float scores and the maximum absolute score error.
+        """
+        if self.U is None:
+            raise ValueError("The float factors were dropped by quantize(keep_float=False), nothing to compare to")
+        U_q, U_scale = quantize_int8(self.U)
+        V_q, V_scale = quantize_int8(self.V)
+        if user_indices is None:
+            user_indices = np.arange(self.U.shape[0])
+
+        overlaps, max_error = [], 0.0
+        for start in range(0, len(user_indices), block_size):
+            users = user_indices[start:start + block_size]
+            ref_scores = self.U[users].dot(self.V.T)
+            scores = int8_scores(U_q[users], U_scale[users], V_q, V_scale)
+            overlaps.append(top_k_overlap(scores, ref_scores, top_k))
+            max_error = max(max_error, float(np.abs(scores - ref_scores).max()))
+
+        overlaps = np.concatenate(overlaps)
+        return {
+            "Overlap@k": overlaps.mean(),
+            "MinOverlap@k": overlaps.min(),
+            "MaxAbsError": max_error,
+        }
@@ -0,0 +1,178 @@
+import os
+import hashlib
+import logging
+from glob import glob
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from tqdm.auto import tqdm
+from WRMF.wrmf_utils import *
+
+log = logging.getLogger(__name__)
+
+ID_MAP_FILE = "id_map.npz"
+BLOCK_FILE = "block_{:010d}.npz"
+ERROR_RESUME = "Output directory {} holds a job with different parameters ({}). Use another directory."
+ERROR_FACTORS = "Output directory {} holds a job of a model with different factors. Use another directory."
+ERROR_NO_JOB = "No batch recommendation job in {}"
+ERROR_NO_SEEN = "The train set keeps no ratings (e.g. a model saved with lean=True), use remove_seen=False"
+
+
+def _score_block(model, start, end, k, remove_seen):
+    scores = model.score_batch(np.arange(start, end)).astype(np.float32, copy=False)
+    if remove_seen:
+        mask_seen_items(scores, model.train_set.csr_matrix, slice(start, end))
+    items, top_scores = top_k_scores(scores, k)
+    return items.astype(np.int32), top_scores
+
+
+def _write_block(output_dir, start, end, items, scores):
+    block_file = os.path.join(output_dir, BLOCK_FILE.format(start))
+    tmp_file = block_file + ".tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(f, users=np.arange(start, end, dtype=np.int32), items=items, scores=scores)
+    # a block file only exists once it is complete, which is what resuming relies on
+    os.replace(tmp_file, block_file)
+
+
+def _factors_sha256(model):
+    """sha256 of the factors the model scores with, so that a retrained model of the same shape is told apart."""
+    sha256 = hashlib.sha256()
+    names = ("U_q", "U_scale", "V_q", "V_scale") if getattr(model, "quantized", False) else ("U", "V")
+    for name in names:
+        factors = getattr(model, name, None)
+        if factors is not None:
+            factors = np.ascontiguousarray(factors)
+            sha256.update(str((name, factors.dtype.str, factors.shape)).encode())
+            sha256.update(factors.data)
+    return sha256.hexdigest()
+
+
+def _check_job(output_dir, model, k, block_size, remove_seen):
+    params = np.array([model.train_set.num_users, model.train_set.num_items, k, block_size, int(remove_seen)])
+    factors_sha256 = _factors_sha256(model)
+    id_map_path = os.path.join(output_dir, ID_MAP_FILE)
+
+    if os.path.exists(id_map_path):
+        with np.load(id_map_path, allow_pickle=True) as id_map:
+            if not np.array_equal(id_map["params"], params):
+                raise ValueError(ERROR_RESUME.format(output_dir, id_map["params"]))
+            if "factors_sha256" not in id_map.files or str(id_map["factors_sha256"]) != factors_sha256:
+                raise ValueError(ERROR_FACTORS.format(output_dir))
+        return
+
+    tmp_file = id_map_path + ".tmp"
+    with open(tmp_file, "wb") as f:
+        np.savez(
+            f,
+            user_ids=id_array(model.train_set.uid_map),
+            item_ids=id_array(model.train_set.iid_map),
+            params=params,
+            factors_sha256=factors_sha256,
+        )
+    os.replace(tmp_file, id_map_path)
+
+
+def _clear_job(output_dir):
+    """Remove the files of a previous job, so that a new one starts over."""
+    for path in glob(os.path.join(output_dir, "block_*.npz*")) + glob(os.path.join(output_dir, ID_MAP_FILE + "*")):
+        os.remove(path)
+
+
+def batch_recommend_top_k(model, output_dir, k=100, block_size=4096, n_jobs=1,
+                          remove_seen=True, resume=True, verbose=True):
+    """Recommend top-k items for every user of the train set and stream them to disk.
+    Users are split into blocks of `block_size`. Each block is scored with one GEMM (`model.score_batch`),
+    its seen items are masked with `train_set.csr_matrix`, top-k is taken with argpartition and
+    the result is written to `block_<first user index>.npz` holding
+        users (int32, (n,)), items (int32, (n, k)) and scores (float32, (n, k)).
+    Raw user/item ids of the indices are stored once in `id_map.npz` (user_ids, item_ids).
+    At most `2 * n_jobs` blocks are held in memory at a time.
+
+    Args:
+        model (WRMF.base_recommender.Recommender): trained model with `score_batch` and its train_set.
+        output_dir (str): directory to write the result files to.
+        k (int): top-k for recommendation.
+        block_size (int): number of users scored at a time.
+        n_jobs (int): number of worker threads. Numpy releases the GIL in GEMM and argpartition.
+        remove_seen (bool): flag to remove items seen in the training data.
+        resume (bool): if True, skip blocks already written by a previous run of the same job (same parameters
+            and factors, checked with a sha256 of the factors). If False, the files of a previous job in
+            output_dir are removed first.
+        verbose (bool): show progress.
+
+    Returns:
+        str: output_dir
+    """
+    if remove_seen and model.train_set.csr_matrix is None:
+        raise ValueError(ERROR_NO_SEEN)
+    os.makedirs(output_dir, exist_ok=True)
+    if not resume:
+        _clear_job(output_dir)
+    _check_job(output_dir, model, k, block_size, remove_seen)
+
+    n_users = model.train_set.num_users
+    blocks = [(start, min(start + block_size, n_users)) for start in range(0, n_users, block_size)]
+    if resume:
+        done = set(os.path.basename(f) for f in glob(os.path.join(output_dir, "block_*.npz")))
+        todo = [(start, end) for start, end in blocks if BLOCK_FILE.format(start) not in done]
+        if len(todo) < len(blocks):
+            log.info("Resuming job in {}: {} of {} blocks done".format(output_dir, len(blocks) - len(todo), len(blocks)))
+        blocks = todo
+
+    progress = tqdm(total=sum(end - start for start, end in blocks), unit="users", disable=not verbose)
+    with ThreadPoolExecutor(max_workers=n_jobs) as executor:
+        pending = {}
+        blocks = iter(blocks)
+        while True:
+            for start, end in blocks:
+                future = executor.submit(_score_block, model, start, end, k, remove_seen)
+                pending[future] = (start, end)
+                if len(pending) >= 2 * n_jobs:
+                    break
+
+            if not pending:
+                break
+
+            finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in finished:
+                start, end = pending.pop(future)
+                _write_block(output_dir, start, end, *future.result())
+                progress.update(end - start)
+    progress.close()
+
+    return output_dir
+
+
+def load_batch_recommendations(output_dir, raw_ids=False):
+    """Load the result of `batch_recommend_top_k`.
+
+    Args:
+        output_dir (str): directory the job wrote to.
+        raw_ids (bool): if True, return raw user/item ids instead of indices.
+
+    Returns:
+        (np.array, np.array, np.array): users (n_users, ), items (n_users, k) and scores (n_users, k)
+    """
+    id_map_path = os.path.join(output_dir, ID_MAP_FILE)
+    if not os.path.exists(id_map_path):
+        raise ValueError(ERROR_NO_JOB.format(output_dir))
+
+    users, items, scores = [], [], []
+    for block_file in sorted(glob(os.path.join(output_dir, "block_*.npz"))):
+        with np.load(block_file) as block:
+            users.append(block["users"])
+            items.append(block["items"])
+            scores.append(block["scores"])
+
+    if users:
+        users, items, scores = np.concatenate(users), np.concatenate(items), np.concatenate(scores)
+    else:
+        # no user was scored yet (or the train set has none)
+        with np.load(id_map_path, allow_pickle=True) as id_map:
+            k = int(id_map["params"][2])
+        users = np.empty(0, dtype=np.int32)
+        items, scores = np.empty((0, k), dtype=np.int32), np.empty((0, k), dtype=np.float32)
+    if raw_ids:
+        with np.load(id_map_path, allow_pickle=True) as id_map:
+            users, items = id_map["user_ids"][users], id_map["item_ids"][items]
+
+    return users, items, scores
@@ -1,5 +1,4 @@
 import pandas as pd
-import cornac
 from WRMF.wrmf_utils import *
 from utils.common.constants import (
     DEFAULT_USER_COL,
@@ -69,9 +68,11 @@ def recommend_top_k(model, data, k):
 
     """
     df_pred_score = predict_score(model, data)
+    # stable sort, so ties keep their order as with nlargest(keep="first")
     top_k_items = (
-        df_pred_score.groupby(DEFAULT_USER_COL, as_index=False).apply(
-            lambda x: x.nlargest(k, DEFAULT_PREDICTION_COL)).reset_index(drop=True)
+        df_pred_score.sort_values([DEFAULT_USER_COL, DEFAULT_PREDICTION_COL], ascending=[True, False],
+                                  kind="mergesort")
+        .groupby(DEFAULT_USER_COL, sort=False).head(k).reset_index(drop=True)
     )
     top_k_items["rank"] = top_k_items.groupby(DEFAULT_USER_COL, sort=False).cumcount() + 1
     top_k_recommend = top_k_items.pivot_table(values=DEFAULT_ITEM_COL, index=DEFAULT_USER_COL,
@@ -151,3 +151,123 @@ def weight_item_popularity(data, alpha, c_0):
     f_vec = u_j / u_j.sum()
     f_alpha_vec = f_vec ** alpha
     return c_0 * (f_alpha_vec / f_alpha_vec.sum())
+
+
+def quantize_int8(X):
+    """Symmetric int8 quantization of a factor matrix with one scale per row.
+
+    Args:
+        X (np.array): (n_rows, k) size factor matrix.
+
+    Returns:
+        (np.array, np.array): (n_rows, k) int8 matrix q and (n_rows, ) float32 scales, X ~ q * scale[:, None]
+    """
+    scale = np.abs(X).max(axis=1).astype(np.float32) / 127
+    scale[scale == 0] = 1
+    q = np.rint(X / scale[:, None]).astype(np.int8)
+    return q, scale
+
+
+def dequantize_int8(q, scale):
+    """Return the float32 factor matrix approximated by int8 factors q and their row scales."""
+    return q.astype(np.float32) * scale[:, None]
+
+
+def int8_scores(U_q, U_scale, V_q, V_scale, block_size=4096):
+    """Return U V^T computed from int8 quantized factors.
+    Int8 products are accumulated exactly: with k * 127^2 < 2^24 every partial sum is an integer representable
+    in float32, so the blocked float32 GEMM over the widened int8 values is an integer accumulation.
+    Only a (block_size, k) slice of V is widened at a time, the rest stays int8 in memory. NumPy has no int8
+    GEMM, so this saves memory, not time: batched scoring is slower than a float32 GEMM, single-user scoring
+    (memory-bound) is on par.
+
+    Args:
+        U_q (np.array): (n_users, k) int8 user factors.
+        U_scale (np.array): (n_users, ) user scales.
+        V_q (np.array): (n_items, k) int8 item factors.
+        V_scale (np.array): (n_items, ) item scales.
+        block_size (int): number of items widened at a time.
+
+    Returns:
+        np.array: (n_users, n_items) float32 scores.
+    """
+    acc_dtype = np.float32 if U_q.shape[1] * 127 ** 2 < 2 ** 24 else np.float64
+    U_acc = U_q.astype(acc_dtype)
+    scores = np.empty((U_q.shape[0], V_q.shape[0]), dtype=np.float32)
+    for start in range(0, V_q.shape[0], block_size):
+        end = start + block_size
+        scores[:, start:end] = U_acc.dot(V_q[start:end].astype(acc_dtype).T)
+    scores *= U_scale[:, None]
+    scores *= V_scale[None, :]
+    return scores
+
+
+def top_k_overlap(scores, ref_scores, k):
+    """Return the per-row overlap of top-k items between two score matrices.
+
+    Args:
+        scores (np.array): (n_users, n_items) scores to check.
+        ref_scores (np.array): (n_users, n_items) reference scores.
+        k (int): number of top items to compare.
+
+    Returns:
+        np.array: (n_users, ) fraction of reference top-k items also found in the top-k of scores.
+    """
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    ref_top = np.argpartition(-ref_scores, k - 1, axis=1)[:, :k]
+    top.sort(axis=1)
+    ref_top.sort(axis=1)
+    # top-k rows are unique item ids, so a match count on the concatenated sorted rows gives the intersection
+    both = np.sort(np.concatenate([top, ref_top], axis=1), axis=1)
+    return (both[:, 1:] == both[:, :-1]).sum(axis=1) / k
+
+
+def id_array(id_map):
+    """Return raw ids ordered by their index.
+
+    Args:
+        id_map (dict): raw id to index mapping, e.g. uid_map or iid_map of a train set.
+
+    Returns:
+        np.array: (len(id_map), ) raw ids, id_array(id_map)[id_map[raw_id]] == raw_id
+    """
+    if hasattr(id_map, "ids"):
+        # ArrayIdMap
+        return id_map.ids
+    raw_ids = np.array(list(id_map.keys()))
+    return raw_ids[np.argsort(np.fromiter(id_map.values(), dtype=np.int64, count=len(id_map)))]
+
+
+def mask_seen_items(scores, seen, user_indices, fill_value=-np.inf):
+    """Set the scores of items already seen by the users to fill_value, in place.
+
+    Args:
+        scores (np.array): (len(user_indices), n_items) scores.
+        seen (scipy.sparse.csr_matrix): (n_users, n_items) user-item matrix of seen items, e.g. train_set.csr_matrix.
+        user_indices (slice or np.array): users of the scores rows.
+        fill_value (scalar): score given to seen items.
+
+    Returns:
+        np.array: scores
+    """
+    seen = seen[user_indices]
+    rows = np.repeat(np.arange(seen.shape[0]), np.diff(seen.indptr))
+    scores[rows, seen.indices] = fill_value
+    return scores
+
+
+def top_k_scores(scores, k):
+    """Return the top-k items of every row of a score matrix, best first.
+
+    Args:
+        scores (np.array): (n_users, n_items) scores.
+        k (int): number of items to return.
+
+    Returns:
+        (np.array, np.array): (n_users, k) item indices and their scores.
+    """
+    k = min(k, scores.shape[1])
+    top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+    top_scores = np.take_along_axis(scores, top, axis=1)
+    order = np.argsort(-top_scores, axis=1, kind="stable")
+    return np.take_along_axis(top, order, axis=1), np.take_along_axis(top_scores, order, axis=1)